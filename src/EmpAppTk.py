@@ -5,6 +5,7 @@ def main():
     db = EmpDb(init=False, dbName='EmpDb.csv')
     app = EmpGuiTk(dataBase=db)
     app.mainloop()
+    db.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,90 +1,551 @@
-from EmpDbEntry import EmpDbEntry
+from EmpDbStorage import EmpDbRowStorage, EmpDbColumnStorage, EmpDbSlotRanks, EmpDbSortedKeys
+from EmpDbLog import EmpDbLog
+import EmpDbExport
 
-import json
 import os
 import csv
+import itertools
+import threading
+from collections import OrderedDict
 
 class EmpDb:
     """
     - simple database to store EmpDbEntry objects
     """    
 
-    def __init__(self, init=False, dbName='EmpDb.csv'):
+    # fields of EmpDbEntry in the order used by fetch_students()
+    FIELDS = ('id', 'name', 'program', 'gender', 'status')
+
+    # storage engines selectable with the 'storage' argument
+    STORAGES = {'rows': EmpDbRowStorage, 'columnar': EmpDbColumnStorage}
+
+    # a background checkpoint starts once the log holds this many records, or one per row if that is more
+    CHECKPOINT_RECORDS = 10000
+
+    # most ids whose changes are kept for export_delta(), the oldest are dropped beyond it
+    # and a delta starting before them needs a full export
+    CHANGES_LIMIT = 65536
+
+    def __init__(self, init=False, dbName='EmpDb.csv', indexes=('program', 'gender', 'status'), storage='rows', durable=False, nameIndex=True):
         """
         - initialize database variables here
         - mandatory :
             - any type can be used to store database entries for EmpDbEntry objects
             - e.g. list of class, list of dictionary, list of tuples, dictionary of tuples etc.
+        - indexes : fields that get a secondary index for find_students(), empty to disable
+        - nameIndex : keep the sorted name index used by search_by_name_prefix()
+        - storage : 'rows' keeps one tuple per row,
+                    'columnar' keeps one column per field with program, gender and status dictionary encoded
+        - dbName : name of the database files, the CSV snapshot dbName + '.snap' is loaded at startup
+                   and changes are appended to dbName + '.log', export_csv() writes to dbName itself
+                   None keeps the database in memory only
+        - init : start with an empty database, discarding the files of dbName
+        - durable : fsync the log after every change instead of only flushing it
         """
         # CSV filename         
         self.dbName = dbName
+        # snapshot written by checkpoints, a file of its own so a failed export cannot damage it
+        self.snapName = None if dbName is None else dbName + '.snap'
         # initialize container of database entries 
-        self.dbEntries = []
+        if storage not in self.STORAGES:
+            raise Exception(f"Unknown storage '{storage}'")
+        self.dbEntries = self.STORAGES[storage]()
+        # primary key index, maps id -> slot of the entry in dbEntries
+        self.dbIndex = {}
+        # number of deleted slots in dbEntries waiting for compaction
+        self.dbHoles = 0
+        # EmpDbSlotRanks of dbEntries used by fetch_range(), exists only while there are holes
+        self.slotRanks = None
+        # secondary indexes, maps field -> value -> set of ids
+        for field in indexes:
+            if field not in self.FIELDS or field == 'id':
+                raise Exception(f"Cannot index field '{field}'")
+        self.fieldIndexes = {field: {} for field in indexes}
+        # sorted name index, EmpDbSortedKeys of (casefolded name, slot), None if disabled
+        self.nameIndex = EmpDbSortedKeys() if nameIndex else None
+        # data version, incremented by every change
+        self.version = 0
+        # oldest version export_delta() can start from
+        self.baseVersion = 0
+        # changed ids, maps id -> (version, existed before its first tracked change, versions it was inserted or deleted in),
+        # oldest change first
+        self.changes = OrderedDict()
+        # rows returned by fetch_students() and the version they belong to
+        self.snapshot = None
+        self.snapshotVersion = None
+        # version of every export, maps (outputFile, compression) -> version, and of the last export_delta()
+        self.exportVersions = {}
+        self.deltaVersion = 0
+        # change log and the thread writing the current checkpoint
+        self.dbLog = None
+        self.checkpointThread = None
+        if dbName is not None:
+            self.load(init, durable)
+
+    def load(self, init, durable):
+        """
+        - loads the snapshot in snapName and replays the change log on top of it
+        - a database written before snapName existed kept its snapshot in dbName, it is loaded from there
+        - opens the change log for the following changes
+        - no return value
+        """
+        logName = self.dbName + '.log'
+        # the name index is built with a single sort once everything is loaded
+        nameIndex, self.nameIndex = self.nameIndex, None
+        legacy = not init and not os.path.exists(self.snapName) and os.path.exists(self.dbName)
+        if init:
+            for path in (self.dbName, self.snapName, logName, logName + '.old'):
+                if os.path.exists(path):
+                    os.remove(path)
+        elif os.path.exists(self.snapName) or os.path.exists(self.dbName):
+            # replaying the log is idempotent, so a dbName exported after the log started is a valid start too
+            # the snapshot is the starting point, not a change, its rows are not tracked
+            changes, self.changes = self.changes, None
+            try:
+                self.import_csv(self.snapName if os.path.exists(self.snapName) else self.dbName)
+            finally:
+                self.changes = changes
+            self.version = self.baseVersion = 0
+
+        # the .old log is left behind by an interrupted checkpoint, it is older than the current log
+        replayed = 0
+        for path in (logName + '.old', logName):
+            for record in EmpDbLog.records(path):
+                self.replay(record)
+                replayed += 1
+        if nameIndex is not None:
+            self.nameIndex = nameIndex
+            self.index_names(self.dbIndex.values())
+
+        self.dbLog = EmpDbLog(logName, durable)
+        self.dbLog.count = replayed
+        if legacy or os.path.exists(self.dbLog.oldName):
+            # everything is replayed, start over from a fresh snapshot,
+            # export_csv() writes to dbName so a legacy database must not depend on it any longer
+            self.write_snapshot(list(self.dbEntries.rows()))
+            self.dbLog.truncate()
+            self.dbLog.append(['version', self.version])
+        self.deltaVersion = self.baseVersion
+
+    def replay(self, record):
+        """
+        - applies one change log record, see EmpDbLog
+        - no return value
+        """
+        if record[0] == 'put':
+            id = record[1]
+            if id in self.dbIndex:
+                self.update_student(*record[1:], id)
+            else:
+                self.insert_student(*record[1:])
+        elif record[0] == 'del':
+            self.delete_student(record[1])
+        elif record[0] == 'version':
+            # written at the start of every log, the snapshot holds everything up to this version
+            if not self.changes:
+                self.baseVersion = record[1]
+            self.version = record[1]
+
+    def track_change(self, id, inserted=False, deleted=False):
+        """
+        - bumps the data version and records that 'id' changed in it
+        - keeps at most CHANGES_LIMIT ids, dropping the oldest moves baseVersion past its change
+        - only bumps the version while changes is None, e.g. while load() imports the snapshot
+        - no return value
+        """
+        self.version += 1
+        if self.changes is None:
+            return
+        old = self.changes.pop(id, None)
+        if old is not None:
+            existed, toggles = old[1], old[2]
+        else:
+            # only an insert can be the first change of an id that did not exist
+            existed, toggles = not inserted, ()
+        if inserted or deleted:
+            toggles += (self.version,)
+        self.changes[id] = (self.version, existed, toggles)
+        if len(self.changes) > self.CHANGES_LIMIT:
+            dropped = self.changes.popitem(last=False)
+            self.baseVersion = dropped[1][0]
+
+    def iter_changes(self, sinceVersion):
+        """
+        - yields (op, row) for every entry changed after 'sinceVersion', oldest change first
+        - op is 'insert', 'update' or 'delete', a deleted row only holds the id
+        - the op compares the entry at 'sinceVersion' with the current one,
+          an id deleted before 'sinceVersion' and inserted again after it is an insert
+        - the work is proportional to the number of changes, not to the table size
+        """
+        changed = []
+        for id, (version, existed, toggles) in reversed(self.changes.items()):
+            if version <= sinceVersion:
+                break
+            # every insert or delete flips the existence of the entry
+            existedThen = existed != (sum(1 for toggled in toggles if toggled <= sinceVersion) % 2 == 1)
+            existsNow = existed != (len(toggles) % 2 == 1)
+            if existsNow:
+                changed.append(('update' if existedThen else 'insert', self.dbEntries.get(self.dbIndex[id])))
+            elif existedThen:
+                changed.append(('delete', (id,)))
+        return reversed(changed)
+
+    def log_change(self, *records):
+        """
+        - appends the records to the change log and starts a checkpoint when the log is long enough
+        - no return value
+        """
+        if self.dbLog is None:
+            return
+
+        self.dbLog.append(*records)
+        if self.dbLog.count >= max(self.CHECKPOINT_RECORDS, len(self.dbIndex)):
+            self.checkpoint()
+
+    def checkpoint(self, background=True):
+        """
+        - writes a snapshot of the database to snapName and drops the log records it covers
+        - background : write the snapshot on a separate thread,
+                       skipped if the previous checkpoint is still running
+        - no return value
+        """
+        if self.dbLog is None:
+            return
+
+        if self.checkpointThread is not None and self.checkpointThread.is_alive():
+            if background:
+                return
+            self.checkpointThread.join()
+
+        # rows are immutable tuples, the list is a consistent view even while the database changes
+        rows = list(self.dbEntries.rows())
+        if os.path.exists(self.dbLog.oldName):
+            # the last background snapshot failed, no snapshot covers the records of the rotated log
+            # and rotating again would replace them, so the snapshot is written first, as load() does
+            self.write_snapshot(rows)
+            self.dbLog.truncate()
+            self.dbLog.append(['version', self.version])
+            return
+        self.dbLog.rotate()
+        self.dbLog.append(['version', self.version])
+        if background:
+            self.checkpointThread = threading.Thread(target=self.write_snapshot, args=(rows,), daemon=True)
+            self.checkpointThread.start()
+        else:
+            self.write_snapshot(rows)
+
+    def write_snapshot(self, rows):
+        """
+        - writes 'rows' to snapName through a temporary file, then removes the rotated log
+        - no return value
+        """
+        tmpName = self.snapName + '.tmp'
+        with open(tmpName, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(self.FIELDS)
+            writer.writerows(rows)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+        os.replace(tmpName, self.snapName)
+        self.dbLog.discard_old()
+
+    def close(self):
+        """
+        - waits for a running checkpoint and closes the change log
+        - no return value
+        """
+        if self.checkpointThread is not None:
+            self.checkpointThread.join()
+            self.checkpointThread = None
+        if self.dbLog is not None:
+            self.dbLog.close()
+            self.dbLog = None
 
     def fetch_students(self):
         """
-        - returns a list of tuples containing Student entry fields
+        - returns a tuple of tuples containing Student entry fields
+        - the snapshot is cached and returned again as long as the version is unchanged
         - example
-          [('123', 'Brian Baker', 'SW-Engineer', 'Male', 'On-Site'),
+          (('123', 'Brian Baker', 'SW-Engineer', 'Male', 'On-Site'),
            ('124', 'Eileen Dover', 'SW-Engineer', 'Male', 'On-Site'),
-           ('125', 'Ann Chovey', 'SW-Engineer', 'Male', 'On-Site')]
+           ('125', 'Ann Chovey', 'SW-Engineer', 'Male', 'On-Site'))
         """
-        studentList = [(entry.id, entry.name, entry.program, entry.gender, entry.status) for entry in self.dbEntries]
-        return studentList
+        if self.snapshotVersion != self.version:
+            self.snapshot = tuple(self.dbEntries.rows())
+            self.snapshotVersion = self.version
+        return self.snapshot
+
+    def fetch_range(self, start, limit=100):
+        """
+        - returns a list of up to 'limit' Student entry tuples, starting at position 'start' of fetch_students() order
+        - reads the slots directly while no slot is empty, otherwise finds the slot of every position
+          with slotRanks, so a call costs O(limit log n) and never walks the table
+        """
+        if not self.dbHoles:
+            return [self.dbEntries.get(slot) for slot in range(start, min(start + limit, len(self.dbEntries)))]
+        find = self.slotRanks.find
+        return [self.dbEntries.get(find(position)) for position in range(start, min(start + limit, len(self.dbIndex)))]
+
+    def range_key(self, id):
+        """
+        - returns a value that sorts 'id' like the entries of fetch_range(), its slot
+        - returns None if 'id' does not exist, read it before deleting the entry
+        """
+        return self.dbIndex.get(id)
+
+    def count_where(self, **filters):
+        """
+        - returns the number of entries matching every field=value filter, e.g. count_where(program='BS CoE')
+        - no filter counts every entry
+        """
+        if not filters:
+            return len(self.dbIndex)
+        return len(self.find_students(**filters))
+
+    def changed_since(self, version):
+        """
+        - returns True if the database changed after 'version', a value of the 'version' attribute
+        """
+        return self.version != version
 
     def insert_student(self, id, name, program, gender, status):
         """
         - inserts an entry in the database
+        - raises an Exception if an entry with the same 'id' already exists
         - no return value
         """
-        newEntry = EmpDbEntry(id=id, name=name, program=program, gender=gender, status=status)
-        self.dbEntries.append(newEntry)
+        if id in self.dbIndex:
+            raise Exception(f"ID {id} already exists")
+
+        newEntry = (id, name, program, gender, status)
+        slot = self.dbEntries.append(newEntry)
+        self.dbIndex[id] = slot
+        if self.slotRanks is not None:
+            self.slotRanks.append()
+        self.index_entry(newEntry)
+        self.index_name(name, slot)
+        self.track_change(id, inserted=True)
+        self.log_change(['put', *newEntry])
+
+    def insert_many(self, rows):
+        """
+        - inserts every (id, name, program, gender, status) row of 'rows' in the database
+        - the ids are checked first, if one already exists or repeats nothing is inserted
+        - the whole batch is written to the change log with a single append
+        - returns the number of inserted rows
+        """
+        newEntries = [tuple(row) for row in rows]
+        seen = set()
+        for entry in newEntries:
+            if entry[0] in self.dbIndex or entry[0] in seen:
+                raise Exception(f"ID {entry[0]} already exists")
+            seen.add(entry[0])
+
+        first = self.dbEntries.extend(newEntries)
+        if self.slotRanks is not None:
+            for entry in newEntries:
+                self.slotRanks.append()
+        self.dbIndex.update(zip((entry[0] for entry in newEntries), range(first, first + len(newEntries))))
+        for entry in newEntries:
+            self.index_entry(entry)
+            self.track_change(entry[0], inserted=True)
+        self.index_names(range(first, first + len(newEntries)))
+        self.log_change(*(['put', *entry] for entry in newEntries))
+        return len(newEntries)
 
     def delete_student(self, id):
         """
         - deletes the corresponding entry in the database as specified by 'id'
+        - the slot is left empty and reclaimed later by compact()
         - no return value
         """
-        self.dbEntries = [entry for entry in self.dbEntries if entry.id != id]
+        slot = self.dbIndex.pop(id, None)
+        if slot is None:
+            return
+
+        oldEntry = self.dbEntries.get(slot)
+        self.unindex_entry(oldEntry)
+        self.unindex_name(oldEntry[1], slot)
+        if self.slotRanks is None:
+            self.slotRanks = EmpDbSlotRanks(len(self.dbEntries))
+        self.slotRanks.clear(slot)
+        self.dbEntries.clear(slot)
+        self.dbHoles += 1
+        self.track_change(id, deleted=True)
+        self.log_change(['del', id])
+        if self.dbHoles > 1024 and self.dbHoles * 2 > len(self.dbEntries):
+            self.compact()
 
     def update_student(self, new_id, new_name, new_program, new_gender, new_status, id):
         """
         - updates the corresponding entry in the database as specified by 'id'
+        - the entry keeps its position even if its id changes
+        - raises an Exception if 'new_id' is already used by another entry
+        - no return value
+        """
+        slot = self.dbIndex.get(id)
+        if slot is None:
+            return
+
+        if new_id != id:
+            if new_id in self.dbIndex:
+                raise Exception(f"ID {new_id} already exists")
+            del self.dbIndex[id]
+            self.dbIndex[new_id] = slot
+
+        oldEntry = self.dbEntries.get(slot)
+        self.unindex_entry(oldEntry)
+        newEntry = (new_id, new_name, new_program, new_gender, new_status)
+        self.dbEntries.set(slot, newEntry)
+        self.index_entry(newEntry)
+        if new_name != oldEntry[1]:
+            self.unindex_name(oldEntry[1], slot)
+            self.index_name(new_name, slot)
+        if new_id != id:
+            self.track_change(id, deleted=True)
+            self.track_change(new_id, inserted=True)
+            self.log_change(['del', id], ['put', *newEntry])
+        else:
+            self.track_change(id)
+            self.log_change(['put', *newEntry])
+
+    def compact(self):
+        """
+        - removes the empty slots left behind by delete_student()
+        - rebuilds the primary key and name indexes for the new slot positions
+        - no return value
+        """
+        self.dbEntries.compact()
+        self.dbIndex = {entry[0]: slot for slot, entry in enumerate(self.dbEntries.rows())}
+        if self.nameIndex is not None:
+            self.nameIndex = EmpDbSortedKeys((str(entry[1]).casefold(), slot) for slot, entry in enumerate(self.dbEntries.rows()))
+        self.dbHoles = 0
+        self.slotRanks = None
+
+    def index_name(self, name, slot):
+        """
+        - adds the entry in 'slot' to the sorted name index
+        - no return value
+        """
+        if self.nameIndex is not None:
+            self.nameIndex.add((str(name).casefold(), slot))
+
+    def index_names(self, slots):
+        """
+        - adds the entries in 'slots' to the sorted name index
+        - no return value
+        """
+        if self.nameIndex is not None:
+            self.nameIndex.update((str(self.dbEntries.get(slot)[1]).casefold(), slot) for slot in slots)
+
+    def unindex_name(self, name, slot):
+        """
+        - removes the entry in 'slot' from the sorted name index
         - no return value
         """
-        for entry in self.dbEntries:
-            if entry.id == id:
-                entry.id = new_id
-                entry.name = new_name
-                entry.program = new_program
-                entry.gender = new_gender
-                entry.status = new_status
+        if self.nameIndex is not None:
+            self.nameIndex.remove((str(name).casefold(), slot))
+
+    def search_by_name_prefix(self, prefix, limit=10):
+        """
+        - returns up to 'limit' Student entry tuples whose name starts with 'prefix', ignoring case
+        - matches are sorted by name, the lookup is a binary search on the sorted name index
+        """
+        if self.nameIndex is None:
+            raise Exception("The name index is disabled")
+
+        key = str(prefix).casefold()
+        matches = []
+        for name, slot in self.nameIndex.irange((key,)):
+            if len(matches) >= limit or not name.startswith(key):
                 break
+            matches.append(self.dbEntries.get(slot))
+        return matches
 
-    def export_csv(self):
+    def index_entry(self, entry):
+        """
+        - adds the entry tuple to every secondary index
+        - no return value
+        """
+        for field, index in self.fieldIndexes.items():
+            index.setdefault(entry[self.FIELDS.index(field)], set()).add(entry[0])
+
+    def unindex_entry(self, entry):
+        """
+        - removes the entry tuple from every secondary index
+        - no return value
+        """
+        for field, index in self.fieldIndexes.items():
+            value = entry[self.FIELDS.index(field)]
+            ids = index[value]
+            ids.discard(entry[0])
+            if not ids:
+                del index[value]
+
+    def find_students(self, **filters):
+        """
+        - returns a list of tuples for the entries matching every filter
+        - filters are field=value pairs, e.g. find_students(program='BS CoE', status='Enrolled')
+        - indexed fields are resolved by intersecting the index sets, starting with the smallest
+        - other fields are checked only on the remaining candidates
+        - rows are returned in the same order as fetch_students()
+        """
+        for field in filters:
+            if field not in self.FIELDS:
+                raise Exception(f"Unknown field '{field}'")
+
+        indexed = [self.fieldIndexes[field].get(value, set()) for field, value in filters.items() if field in self.fieldIndexes]
+        unindexed = [(self.FIELDS.index(field), value) for field, value in filters.items() if field not in self.fieldIndexes]
+
+        if indexed:
+            indexed.sort(key=len)
+            ids = indexed[0].intersection(*indexed[1:])
+            entries = [self.dbEntries.get(slot) for slot in sorted(self.dbIndex[id] for id in ids)]
+        else:
+            entries = self.dbEntries.rows()
+
+        return [entry for entry in entries if all(entry[column] == value for column, value in unindexed)]
+
+    def iter_students(self):
+        """
+        - yields the Student entry tuples one by one, in fetch_students() order
+        - the database must not change while the iteration is running
+        """
+        return self.dbEntries.rows()
+
+    def export_csv(self, outputFile=None, compression=None):
         """
         - exports database entries as a CSV file
         - CSV : Comma Separated Values
-        - no return value
+        - rows are streamed from storage to the file
+        - outputFile : defaults to dbName, with '.gz' or '.xz' added when compressed
+        - compression : None, 'gzip' or 'lzma'
+        - returns False without writing if nothing changed since the last export to outputFile
         - example
+        id,name,program,gender,status
         12,Eileen Dover,SW-Engineer,Male,On-Site
         13,Ann Chovey,HW-Engineer,Female,On-Site
         14,Chris P. Bacon,SW-Engineer,Male,On-Leave
         15,Russell Sprout,SW-Engineer,Male,Remote
         16,Oscar Lott,Project-Manager,Male,On-Site        
         """
-        import csv
-        with open(self.dbName, 'w', newline='') as csvfile:
-            fieldnames = ['id', 'name', 'program', 'gender', 'status']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for entry in self.dbEntries:
-                writer.writerow({'id': entry.id, 'name': entry.name, 'program': entry.program, 'gender': entry.gender, 'status': entry.status})
+        if outputFile is None:
+            if self.dbName is None:
+                raise Exception("No output file for an in-memory database")
+            outputFile = self.dbName + EmpDbExport.EXTENSIONS[compression]
+        if not self.export_needed(outputFile, compression):
+            return False
+        EmpDbExport.write_csv(outputFile, self.iter_students(), compression)
+        self.exportVersions[(outputFile, compression)] = self.version
+        return True
 
-    def export_json(self, outputFile='students.json'):
+    def export_json(self, outputFile=None, compression=None):
         """
         - exports database entries as a JSON file
-        - no return value
+        - the JSON array is written incrementally while the rows are streamed from storage
+        - outputFile : defaults to 'students.json', with '.gz' or '.xz' added when compressed
+        - compression : None, 'gzip' or 'lzma'
+        - returns False without writing if nothing changed since the last export to outputFile
         - example
         [
             {"id": "123", "name": "Brian Baker", "program": "SW-Engineer", "gender": "Male", "status": "On-Site"},
@@ -92,11 +553,41 @@ class EmpDb:
             {"id": "125", "name": "Ann Chovey", "program": "SW-Engineer", "gender": "Male", "status": "On-Site"}
         ]
         """
-        records = [{'id': entry.id, 'name': entry.name, 'program': entry.program, 'gender': entry.gender, 'status': entry.status} for entry in self.dbEntries]
+        if outputFile is None:
+            outputFile = 'students.json' + EmpDbExport.EXTENSIONS[compression]
+        if not self.export_needed(outputFile, compression):
+            return False
+        EmpDbExport.write_json(outputFile, self.iter_students(), compression)
+        self.exportVersions[(outputFile, compression)] = self.version
+        return True
+
+    def export_needed(self, outputFile, compression):
+        """
+        - returns False if outputFile still holds an export of the current version
+        """
+        return self.exportVersions.get((outputFile, compression)) != self.version or not os.path.exists(outputFile)
+
+    def export_delta(self, outputFile, sinceVersion=None, compression=None):
+        """
+        - exports only the entries inserted, updated or deleted after 'sinceVersion' as a CSV file
+        - sinceVersion : defaults to the version returned by the previous export_delta()
+        - compression : None, 'gzip' or 'lzma'
+        - returns the current version, to be passed as sinceVersion next time
+        - raises an Exception if the changes since 'sinceVersion' are not known, a full export is needed then
+        - example
+        op,id,name,program,gender,status
+        insert,17,Ann Chovey,BS EE,Female,Enrolled
+        update,12,Eileen Dover,BS CoE,Female,Not Enrolled
+        delete,13
+        """
+        if sinceVersion is None:
+            sinceVersion = self.deltaVersion
+        if sinceVersion < self.baseVersion or sinceVersion > self.version:
+            raise Exception(f"Changes since version {sinceVersion} are not known, a full export is needed")
 
-        # Write to JSON file
-        with open(outputFile, 'w') as f:
-            json.dump(records, f, indent=4)
+        EmpDbExport.write_delta(outputFile, self.iter_changes(sinceVersion), compression)
+        self.deltaVersion = self.version
+        return self.version
 
 
     def id_exists(self, id):
@@ -104,19 +595,400 @@ class EmpDb:
         - returns True if an entry exists for the specified 'id'
         - else returns False
         """
-        return any(entry.id == id for entry in self.dbEntries)
+        return id in self.dbIndex
     
-    def import_csv(self, filePath):
+    def import_csv(self, filePath, chunkSize=10000, progress=None):
         """
             - imports CSV data into the EmpDb object
             - filePath : string, path to CSV file
-            - no return value
+            - chunkSize : number of rows read and inserted with insert_many() at a time,
+                          memory use is bounded by the chunk, not by the file
+            - progress : optional callable, called after every chunk as
+                         progress(rowsImported, bytesRead, totalBytes)
+            - returns the number of imported rows
         """
         if not os.path.exists(filePath) or not os.path.isfile(filePath) or not os.access(filePath, os.R_OK):
             raise Exception("CSV file not found or not readable")
 
-        with open(filePath, 'r') as csvfile:
-            csvreader = csv.reader(csvfile)
-            next(csvreader)  # Skip header row
-            for row in csvreader:
-                self.insert_student(row[0], row[1], row[2], row[3], row[4])
\ No newline at end of file
+        totalBytes = os.path.getsize(filePath)
+        imported = 0
+        # the imported names are added to the name index with a single sort at the end, not one per chunk,
+        # import only appends so they are the slots from firstSlot on
+        nameIndex, self.nameIndex = self.nameIndex, None
+        firstSlot = len(self.dbEntries)
+        try:
+            with open(filePath, 'r', newline='', encoding='utf-8') as csvfile:
+                csvreader = csv.reader(csvfile)
+                next(csvreader, None)  # Skip header row
+                while True:
+                    chunk = [(row[0], row[1], row[2], row[3], row[4]) for row in itertools.islice(csvreader, chunkSize)]
+                    if not chunk:
+                        break
+                    imported += self.insert_many(chunk)
+                    if progress is not None:
+                        # the buffer position runs ahead of the parser by at most one read block
+                        progress(imported, min(csvfile.buffer.tell(), totalBytes), totalBytes)
+        finally:
+            if nameIndex is not None:
+                self.nameIndex = nameIndex
+                self.index_names(range(firstSlot, len(self.dbEntries)))
+        return imported
+
+def test_EmpDb(storage='rows'):
+    iEmpDb = EmpDb(dbName=None, storage=storage)
+
+    for entry in range(30):
+        iEmpDb.insert_student(str(entry), f'Name{entry} Surname{entry}', 'BS CoE', 'Male', 'Enrolled')
+        assert iEmpDb.id_exists(str(entry))
+
+    all_entries = iEmpDb.fetch_students()
+    assert len(all_entries) == 30
+
+    for entry in range(10, 20):
+        iEmpDb.update_student(str(entry + 100), f'Name{entry} Surname{entry}', 'BS EE', 'Female', 'Not Enrolled', str(entry))
+        assert not iEmpDb.id_exists(str(entry))
+        assert iEmpDb.id_exists(str(entry + 100))
+
+    all_entries = iEmpDb.fetch_students()
+    assert len(all_entries) == 30
+    assert iEmpDb.fetch_range(8, 4) == list(all_entries[8:12])
+    assert all_entries[10] == ('110', 'Name10 Surname10', 'BS EE', 'Female', 'Not Enrolled')
+    if storage == 'rows':
+        # unchanged rows are handed out as the same cached tuple
+        iEmpDb.update_student('25', 'Name25 Surname25', 'BS CoE', 'Male', 'Enrolled', '25')
+        again = iEmpDb.fetch_students()
+        assert again[24] is all_entries[24] and again[25] is not all_entries[25]
+
+    for entry in range(10):
+        iEmpDb.delete_student(str(entry))
+        assert not iEmpDb.id_exists(str(entry))
+
+    assert iEmpDb.count_where() == 20
+    assert iEmpDb.fetch_range(0, 3) == list(iEmpDb.fetch_students()[:3])
+    assert iEmpDb.fetch_range(18) == list(iEmpDb.fetch_students()[18:])
+    # slotRanks follows the inserts and deletes made after it was built
+    iEmpDb.insert_many([('200', 'Name200', 'BS EE', 'Male', 'Enrolled'), ('201', 'Name201', 'BS EE', 'Male', 'Enrolled')])
+    iEmpDb.insert_student('202', 'Name202', 'BS EE', 'Male', 'Enrolled')
+    iEmpDb.delete_student('21')
+    assert [iEmpDb.fetch_range(start, 4) for start in range(22)] == [list(iEmpDb.fetch_students()[start:start + 4]) for start in range(22)]
+    for id in ('200', '201', '202'):
+        iEmpDb.delete_student(id)
+    iEmpDb.insert_student('21', 'Name21 Surname21', 'BS CoE', 'Male', 'Enrolled')
+    assert sorted(('119', '110', '25'), key=iEmpDb.range_key) == ['110', '119', '25']
+
+    iEmpDb.compact()
+    assert not iEmpDb.changed_since(iEmpDb.version)
+    assert iEmpDb.fetch_students() is iEmpDb.fetch_students()
+    all_entries = iEmpDb.fetch_students()
+    assert len(all_entries) == 20
+    assert all_entries[0][0] == '110'
+    assert all(iEmpDb.dbEntries.get(iEmpDb.dbIndex[row[0]]) == row for row in all_entries)
+
+    assert len(iEmpDb.find_students(program='BS EE')) == 10
+    assert len(iEmpDb.find_students(program='BS CoE', gender='Male', status='Enrolled')) == 10
+    assert iEmpDb.find_students(program='BS EE', name='Name15 Surname15') == [('115', 'Name15 Surname15', 'BS EE', 'Female', 'Not Enrolled')]
+    assert iEmpDb.find_students(program='BS ECE') == []
+    assert iEmpDb.count_where(program='BS EE', gender='Female') == 10
+    iEmpDb.delete_student('115')
+    iEmpDb.update_student('116', 'Name16 Surname16', 'BS CoE', 'Female', 'Enrolled', '116')
+    assert [row[0] for row in iEmpDb.find_students(gender='Female', status='Not Enrolled')] == ['110', '111', '112', '113', '114', '117', '118', '119']
+    assert iEmpDb.find_students(program='BS CoE', gender='Female') == [('116', 'Name16 Surname16', 'BS CoE', 'Female', 'Enrolled')]
+
+
+def test_EmpDb_columnar():
+    test_EmpDb(storage='columnar')
+
+    iEmpDb = EmpDb(dbName=None, storage='columnar')
+    for entry in range(300):
+        iEmpDb.insert_student(str(entry), f'Name{entry}', f'Program {entry}', 'Male', 'Enrolled')
+    assert iEmpDb.dbEntries.programs.codes.typecode == 'H'
+    assert iEmpDb.fetch_students()[299] == ('299', 'Name299', 'Program 299', 'Male', 'Enrolled')
+
+
+def test_EmpDb_persistence(tmp_path):
+    dbName = str(tmp_path / 'EmpDb.csv')
+
+    iEmpDb = EmpDb(dbName=dbName)
+    for entry in range(20):
+        iEmpDb.insert_student(str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled')
+    iEmpDb.update_student('100', 'Name0', 'BS EE', 'Female', 'Enrolled', '0')
+    iEmpDb.update_student('1', 'Name1', 'BS ECE', 'Male', 'Not Enrolled', '1')
+    iEmpDb.delete_student('2')
+    expected = iEmpDb.fetch_students()
+    iEmpDb.close()
+
+    # nothing was checkpointed yet, the state comes back from the log alone
+    assert not os.path.exists(dbName + '.snap')
+    iEmpDb = EmpDb(dbName=dbName)
+    assert sorted(iEmpDb.fetch_students()) == sorted(expected)
+
+    iEmpDb.checkpoint(background=False)
+    assert list(EmpDbLog.records(dbName + '.log')) == [['version', iEmpDb.version]]
+    iEmpDb.delete_student('3')
+    iEmpDb.close()
+
+    # a torn last record is ignored
+    with open(dbName + '.log', 'a') as logFile:
+        logFile.write('["del", "4"')
+    iEmpDb = EmpDb(dbName=dbName)
+    assert len(iEmpDb.fetch_students()) == 18
+    assert iEmpDb.id_exists('4') and not iEmpDb.id_exists('3')
+    assert len(iEmpDb.nameIndex) == 18 and [row[0] for row in iEmpDb.search_by_name_prefix('name0')] == ['100']
+
+    # a background checkpoint starts by itself once the log is long enough
+    iEmpDb.CHECKPOINT_RECORDS = 10
+    for entry in range(20, 40):
+        iEmpDb.insert_student(str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled')
+    iEmpDb.close()
+    assert not os.path.exists(dbName + '.log.old')
+    assert len(EmpDb(dbName=dbName).fetch_students()) == 38
+
+    assert os.path.exists(dbName + '.snap') and not os.path.exists(dbName)
+
+    # a failed background snapshot leaves the rotated log behind, the next checkpoint keeps its records
+    iEmpDb = EmpDb(dbName=dbName)
+    iEmpDb.insert_student('40', 'Name40', 'BS CoE', 'Male', 'Enrolled')
+    # what checkpoint() does before a background snapshot that then fails
+    iEmpDb.dbLog.rotate()
+    iEmpDb.dbLog.append(['version', iEmpDb.version])
+    iEmpDb.insert_student('41', 'Name41', 'BS CoE', 'Male', 'Enrolled')
+
+    def failing(rows):
+        raise OSError('disk full')
+    iEmpDb.write_snapshot = failing
+    try:
+        iEmpDb.checkpoint()
+    except OSError:
+        pass
+    else:
+        raise AssertionError('snapshot did not fail')
+    iEmpDb.close()
+    assert len(EmpDb(dbName=dbName).fetch_students()) == 40
+
+    assert EmpDb(init=True, dbName=dbName).fetch_students() == ()
+
+    # a database from before snapName loads its snapshot from dbName and writes snapName right away,
+    # an export to dbName that fails part way then loses nothing
+    with open(dbName, 'w', newline='') as csvfile:
+        csv.writer(csvfile).writerows([EmpDb.FIELDS] + [(str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled')
+                                                        for entry in range(100)])
+    iEmpDb = EmpDb(dbName=dbName)
+    assert len(iEmpDb.fetch_students()) == 100 and os.path.exists(dbName + '.snap')
+    iEmpDb.insert_student('100', 'Name100', 'BS CoE', 'Male', 'Enrolled')
+    rows = iEmpDb.iter_students
+
+    def failing():
+        yield from itertools.islice(rows(), 10)
+        raise OSError('disk full')
+    iEmpDb.iter_students = failing
+    try:
+        iEmpDb.export_csv()
+    except OSError:
+        pass
+    else:
+        raise AssertionError('export did not fail')
+    iEmpDb.close()
+    assert len(EmpDb(dbName=dbName).fetch_students()) == 101
+
+
+def test_EmpDb_import(tmp_path, storage='rows'):
+    filePath = str(tmp_path / 'import.csv')
+    with open(filePath, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(EmpDb.FIELDS)
+        for entry in range(250):
+            writer.writerow((str(entry), f'Name{entry}, Jr.', ('BS CoE', 'BS EE')[entry % 2], 'Male', 'Enrolled'))
+
+    iEmpDb = EmpDb(dbName=None, storage=storage)
+    calls = []
+    assert iEmpDb.import_csv(filePath, chunkSize=100, progress=lambda *args: calls.append(args)) == 250
+    assert [call[0] for call in calls] == [100, 200, 250]
+    assert calls[-1][1] == calls[-1][2] == os.path.getsize(filePath)
+    assert iEmpDb.fetch_students()[7] == ('7', 'Name7, Jr.', 'BS EE', 'Male', 'Enrolled')
+    assert len(iEmpDb.find_students(program='BS CoE')) == 125
+    # the name index is sorted once for the whole import
+    assert [row[0] for row in iEmpDb.search_by_name_prefix('name24', limit=11)] == ['24'] + [str(entry) for entry in range(240, 250)]
+
+    # a duplicate id rejects the whole batch
+    try:
+        iEmpDb.insert_many([('300', 'A', 'BS CoE', 'Male', 'Enrolled'), ('7', 'B', 'BS CoE', 'Male', 'Enrolled')])
+    except Exception as e:
+        assert 'ID 7 already exists' in str(e)
+    else:
+        raise AssertionError('duplicate id accepted')
+    assert not iEmpDb.id_exists('300')
+
+
+def test_EmpDb_import_columnar(tmp_path):
+    test_EmpDb_import(tmp_path, storage='columnar')
+
+
+def test_EmpDb_export(tmp_path):
+    import gzip
+    import json
+    import lzma
+
+    iEmpDb = EmpDb(dbName=str(tmp_path / 'EmpDb.csv'))
+    for entry in range(50):
+        iEmpDb.insert_student(str(entry), f'Name{entry}, "Nick" Surname', 'BS CoE', 'Male', 'Enrolled')
+    expected = iEmpDb.fetch_students()
+
+    iEmpDb.export_csv(compression='gzip')
+    with gzip.open(str(tmp_path / 'EmpDb.csv.gz'), 'rt', newline='') as csvfile:
+        rows = list(csv.reader(csvfile))
+    assert rows[0] == list(EmpDb.FIELDS) and tuple(tuple(row) for row in rows[1:]) == expected
+
+    iEmpDb.export_json(str(tmp_path / 'students.json'))
+    with open(str(tmp_path / 'students.json')) as jsonfile:
+        assert json.load(jsonfile) == [dict(zip(EmpDb.FIELDS, row)) for row in expected]
+
+    iEmpDb.export_json(str(tmp_path / 'students.json.xz'), compression='lzma')
+    with lzma.open(str(tmp_path / 'students.json.xz'), 'rt') as jsonfile:
+        assert len(json.load(jsonfile)) == 50
+
+    # an export to dbName that fails part way leaves the snapshot alone
+    iEmpDb.checkpoint(background=False)
+    rows = iEmpDb.iter_students
+
+    def failing():
+        yield from itertools.islice(rows(), 10)
+        raise OSError('disk full')
+    iEmpDb.iter_students = failing
+    try:
+        iEmpDb.export_csv()
+    except OSError:
+        pass
+    else:
+        raise AssertionError('export did not fail')
+    iEmpDb.close()
+    assert EmpDb(dbName=str(tmp_path / 'EmpDb.csv')).fetch_students() == expected
+
+    EmpDb(dbName=None).export_json(str(tmp_path / 'empty.json'))
+    with open(str(tmp_path / 'empty.json')) as jsonfile:
+        assert json.load(jsonfile) == []
+
+
+def test_EmpDb_delta(tmp_path):
+    dbName = str(tmp_path / 'EmpDb.csv')
+    iEmpDb = EmpDb(dbName=dbName)
+    iEmpDb.insert_many((str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled') for entry in range(10))
+    assert iEmpDb.export_json(str(tmp_path / 'students.json'))
+    assert not iEmpDb.export_json(str(tmp_path / 'students.json'))
+    start = iEmpDb.export_delta(str(tmp_path / 'delta0.csv'))
+    assert start == iEmpDb.version == 10
+
+    iEmpDb.update_student('1', 'Name1', 'BS EE', 'Male', 'Enrolled', '1')
+    iEmpDb.delete_student('2')
+    iEmpDb.insert_student('20', 'Name20', 'BS CoE', 'Female', 'Enrolled')
+    iEmpDb.delete_student('20')
+    iEmpDb.update_student('30', 'Name3', 'BS CoE', 'Male', 'Enrolled', '3')
+    iEmpDb.delete_student('4')
+    iEmpDb.insert_student('4', 'Name4 Again', 'BS ECE', 'Male', 'Enrolled')
+    assert iEmpDb.export_json(str(tmp_path / 'students.json'))
+
+    iEmpDb.export_delta(str(tmp_path / 'delta1.csv'))
+    with open(str(tmp_path / 'delta1.csv'), newline='') as csvfile:
+        delta = list(csv.reader(csvfile))
+    assert delta == [['op', 'id', 'name', 'program', 'gender', 'status'],
+                     ['update', '1', 'Name1', 'BS EE', 'Male', 'Enrolled'],
+                     ['delete', '2'],
+                     ['delete', '3'],
+                     ['insert', '30', 'Name3', 'BS CoE', 'Male', 'Enrolled'],
+                     ['update', '4', 'Name4 Again', 'BS ECE', 'Male', 'Enrolled']]
+    version = iEmpDb.version
+    iEmpDb.close()
+
+    # versions survive a restart, older starting points need a full export
+    iEmpDb = EmpDb(dbName=dbName)
+    assert iEmpDb.version == version
+    iEmpDb.checkpoint(background=False)
+    iEmpDb.close()
+    iEmpDb = EmpDb(dbName=dbName)
+    assert iEmpDb.baseVersion == iEmpDb.version == version
+    iEmpDb.delete_student('5')
+    iEmpDb.export_delta(str(tmp_path / 'delta2.csv'), sinceVersion=version)
+    with open(str(tmp_path / 'delta2.csv'), newline='') as csvfile:
+        assert list(csv.reader(csvfile))[1:] == [['delete', '5']]
+
+    # an id whose delete was already exported comes back as an insert, then is deleted again
+    iEmpDb.export_delta(str(tmp_path / 'delta3.csv'))
+    iEmpDb.insert_student('5', 'Name5 Back', 'BS CoE', 'Male', 'Enrolled')
+    middle = iEmpDb.version
+    iEmpDb.delete_student('5')
+    iEmpDb.insert_student('5', 'Name5 Again', 'BS CoE', 'Male', 'Enrolled')
+    iEmpDb.export_delta(str(tmp_path / 'delta4.csv'))
+    with open(str(tmp_path / 'delta4.csv'), newline='') as csvfile:
+        assert list(csv.reader(csvfile))[1:] == [['insert', '5', 'Name5 Again', 'BS CoE', 'Male', 'Enrolled']]
+    iEmpDb.delete_student('5')
+    iEmpDb.export_delta(str(tmp_path / 'delta5.csv'), sinceVersion=middle)
+    with open(str(tmp_path / 'delta5.csv'), newline='') as csvfile:
+        assert list(csv.reader(csvfile))[1:] == [['delete', '5']]
+    try:
+        iEmpDb.export_delta(str(tmp_path / 'delta6.csv'), sinceVersion=start)
+    except Exception as e:
+        assert 'full export' in str(e)
+    else:
+        raise AssertionError('export_delta accepted an unknown starting version')
+    iEmpDb.close()
+
+    # the tracked changes are bounded, the dropped ones move the oldest starting point
+    iEmpDb = EmpDb(dbName=None)
+    iEmpDb.CHANGES_LIMIT = 10
+    iEmpDb.insert_many((str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled') for entry in range(25))
+    assert len(iEmpDb.changes) == 10 and iEmpDb.baseVersion == 15
+    iEmpDb.export_delta(str(tmp_path / 'delta7.csv'), sinceVersion=15)
+    with open(str(tmp_path / 'delta7.csv'), newline='') as csvfile:
+        assert [row[1] for row in csv.reader(csvfile)][1:] == [str(entry) for entry in range(15, 25)]
+
+    # loading a snapshot larger than CHANGES_LIMIT without a log tracks nothing
+    class LimitedEmpDb(EmpDb):
+        CHANGES_LIMIT = 10
+    dbName = str(tmp_path / 'limited.csv')
+    with open(dbName, 'w', newline='') as csvfile:
+        csv.writer(csvfile).writerows([EmpDb.FIELDS] + [(str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled')
+                                                        for entry in range(30)])
+    iEmpDb = LimitedEmpDb(dbName=dbName)
+    assert iEmpDb.baseVersion == iEmpDb.version == 0 and not iEmpDb.changes
+    iEmpDb.insert_student('30', 'Name30', 'BS CoE', 'Male', 'Enrolled')
+    iEmpDb.export_delta(str(tmp_path / 'delta8.csv'))
+    with open(str(tmp_path / 'delta8.csv'), newline='') as csvfile:
+        assert list(csv.reader(csvfile))[1:] == [['insert', '30', 'Name30', 'BS CoE', 'Male', 'Enrolled']]
+    iEmpDb.close()
+
+
+def test_EmpDb_name_prefix():
+    iEmpDb = EmpDb(dbName=None)
+    iEmpDb.insert_many((str(entry), f'Name{entry:03} Surname', 'BS CoE', 'Male', 'Enrolled') for entry in range(200))
+    iEmpDb.insert_student('a', 'allen Magpantay', 'BS EE', 'Male', 'Enrolled')
+    iEmpDb.insert_student('b', 'Allan Reyes', 'BS EE', 'Male', 'Enrolled')
+    iEmpDb.insert_student('c', 'ALLEN Cruz', 'BS EE', 'Male', 'Enrolled')
+
+    assert [row[0] for row in iEmpDb.search_by_name_prefix('all')] == ['b', 'c', 'a']
+    assert [row[0] for row in iEmpDb.search_by_name_prefix('ALLE', limit=1)] == ['c']
+    assert [row[0] for row in iEmpDb.search_by_name_prefix('name01')] == [str(entry) for entry in range(10, 20)]
+    assert len(iEmpDb.search_by_name_prefix('name', limit=50)) == 50
+    assert iEmpDb.search_by_name_prefix('x') == []
+
+    iEmpDb.update_student('c', 'Bea Cruz', 'BS EE', 'Female', 'Enrolled', 'c')
+    iEmpDb.delete_student('b')
+    assert [row[0] for row in iEmpDb.search_by_name_prefix('all')] == ['a']
+    assert iEmpDb.search_by_name_prefix('bea') == [('c', 'Bea Cruz', 'BS EE', 'Female', 'Enrolled')]
+
+    for entry in range(150):
+        iEmpDb.delete_student(str(entry))
+    iEmpDb.compact()
+    assert [row[0] for row in iEmpDb.search_by_name_prefix('name1', limit=100)] == [str(entry) for entry in range(150, 200)]
+
+    # single inserts and deletes land in their chunk, the chunks stay sorted and bounded
+    iEmpDb.nameIndex.CHUNK = 4
+    iEmpDb.nameIndex.build(list(iEmpDb.nameIndex))
+    for entry in range(300, 100, -3):
+        iEmpDb.insert_student(f'n{entry}', f'Name{entry:03} Later', 'BS CoE', 'Male', 'Enrolled')
+    for entry in range(300, 200, -6):
+        iEmpDb.delete_student(f'n{entry}')
+    keys = sorted((str(row[1]).casefold(), iEmpDb.dbIndex[row[0]]) for row in iEmpDb.fetch_students())
+    assert list(iEmpDb.nameIndex) == keys and len(iEmpDb.nameIndex) == len(keys)
+    assert max(len(chunk) for chunk in iEmpDb.nameIndex.chunks) <= 8
+    assert iEmpDb.nameIndex.maxes == [chunk[-1] for chunk in iEmpDb.nameIndex.chunks]
+    assert [row[0] for row in iEmpDb.search_by_name_prefix('name15', limit=20)] == \
+        ['n150', '150', '151', '152', 'n153', '153', '154', '155', 'n156', '156', '157', '158', 'n159', '159']
@@ -0,0 +1,164 @@
+'''
+Asyncio facade for EmpDbSqlite
+- every call runs on one worker thread that owns the database, the caller never touches the disk
+- calls are queued in order, many of them can be in flight at once and complete in that order
+- submit() returns a concurrent.futures.Future for callers without an event loop, like Tk handlers,
+  the EmpDbSqlite method names return coroutines for asyncio code
+'''
+
+import asyncio
+import concurrent.futures
+import queue
+import threading
+
+from EmpDbSqlite import EmpDbSqlite
+
+
+class AsyncEmpDbSqlite:
+    """
+    - runs EmpDbSqlite(dbName, profile, groupCommit) on a worker thread and forwards calls to it
+    - await db.insert_student(...) or db.submit('insert_student', ...) instead of db.insert_student(...)
+    """
+
+    # EmpDbSqlite methods forwarded to the worker,
+    # iter_students() is left out since its generator would run on the caller's thread
+    METHODS = ('fetch_students', 'fetch_page', 'fetch_range', 'count_by', 'count_where', 'search_students', 'id_exists', 'get_student',
+               'insert_student', 'insert_many', 'merge_many', 'update_student', 'delete_student', 'import_csv', 'existing_ids',
+               'export_csv', 'export_json', 'changed_since', 'effective_settings', 'flush',
+               'backup', 'snapshot_to_memory')
+
+    def __init__(self, dbName='Students.db', profile='balanced', groupCommit=None):
+        """
+        - the database is opened on the worker thread, an error opening it fails every request
+        """
+        self.requests = queue.Queue()
+        self.closed = False
+        self.closeLock = threading.Lock()
+        self.db = None
+        self.error = None
+        self.worker = threading.Thread(target=self.run, args=(dbName, profile, groupCommit), name='AsyncEmpDbSqlite', daemon=True)
+        self.worker.start()
+
+    def run(self, dbName, profile, groupCommit):
+        """
+        - worker loop, runs the queued requests one by one until the None sent by shutdown()
+        """
+        try:
+            self.db = EmpDbSqlite(dbName=dbName, profile=profile, groupCommit=groupCommit)
+        except Exception as e:
+            self.error = e
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            future, method, args, kwargs = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            if self.error is not None:
+                # there is nothing to close when the database never opened
+                if method == 'close':
+                    future.set_result(None)
+                else:
+                    future.set_exception(self.error)
+                continue
+            try:
+                result = getattr(self.db, method)(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def submit(self, method, *args, **kwargs):
+        """
+        - queues a call of the EmpDbSqlite method 'method'
+        - returns a concurrent.futures.Future with its result, set once the requests queued before it are done
+        """
+        if method not in self.METHODS:
+            raise Exception(f"Unknown method '{method}'")
+        future = concurrent.futures.Future()
+        with self.closeLock:
+            if self.closed:
+                raise Exception('AsyncEmpDbSqlite is closed')
+            self.requests.put((future, method, args, kwargs))
+        return future
+
+    def __getattr__(self, method):
+        # db.fetch_students(...) returns a coroutine running the call on the worker
+        if method not in self.METHODS:
+            raise AttributeError(method)
+
+        async def call(*args, **kwargs):
+            return await asyncio.wrap_future(self.submit(method, *args, **kwargs))
+        return call
+
+    def shutdown(self, wait=True):
+        """
+        - stops accepting requests, the queued ones still run, then the database is closed
+        - wait : block until the worker has finished
+        - returns the Future of the close, it is done once the database is closed
+        """
+        with self.closeLock:
+            if not self.closed:
+                self.closed = True
+                self.closeFuture = concurrent.futures.Future()
+                self.requests.put((self.closeFuture, 'close', (), {}))
+                self.requests.put(None)
+        if wait:
+            self.worker.join()
+        return self.closeFuture
+
+    async def aclose(self):
+        """
+        - shutdown() for asyncio code, returns once the database is closed
+        """
+        await asyncio.wrap_future(self.shutdown(wait=False))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+def test_EmpDb_async(tmp_path):
+    async def session():
+        async with AsyncEmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db')) as iEmpDb:
+            # pipelined : every insert is queued before the first one completes
+            await asyncio.gather(*(iEmpDb.insert_student(str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled')
+                                   for entry in range(50)))
+            assert await iEmpDb.count_where() == 50
+
+            # requests run in the order they were queued
+            update = iEmpDb.submit('update_student', 'Renamed', 'BS EE', 'Female', 'Enrolled', '7')
+            row = iEmpDb.submit('fetch_page', after_id='6', limit=1)
+            assert await asyncio.wrap_future(row) == [('7', 'Renamed', 'BS EE', 'Female', 'Enrolled')]
+            assert update.done()
+
+            try:
+                await iEmpDb.insert_student('7', 'Dup', 'BS EE', 'Male', 'Enrolled')
+            except Exception as e:
+                assert 'UNIQUE' in str(e)
+            else:
+                raise AssertionError('duplicate id accepted')
+
+            # requests queued before the shutdown still complete
+            last = iEmpDb.submit('delete_student', '0')
+        return iEmpDb, last
+
+    iEmpDb, last = asyncio.run(session())
+    assert last.done() and last.exception() is None
+    assert iEmpDb.db.connections == []
+    iEmpDb.shutdown()
+    assert not iEmpDb.worker.is_alive()
+    for call in (lambda: iEmpDb.submit('fetch_students'), lambda: iEmpDb.submit('close')):
+        try:
+            call()
+        except Exception as e:
+            assert 'closed' in str(e) or 'Unknown method' in str(e)
+        else:
+            raise AssertionError('request accepted')
+
+    # an error opening the database fails the requests instead of killing the worker
+    iEmpDb = AsyncEmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db'), profile='fastest')
+    assert 'profile' in str(iEmpDb.submit('fetch_students').exception(timeout=5))
+    iEmpDb.shutdown()
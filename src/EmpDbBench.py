@@ -0,0 +1,723 @@
+'''
+Benchmarks for the database backends
+- run with : python EmpDbBench.py
+'''
+
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from EmpDb import EmpDb
+from EmpDbAsync import AsyncEmpDbSqlite
+from EmpDbSqlite import EmpDbSqlite
+
+
+def timed(func, repeat):
+    """
+    - calls func(i) for i in range(repeat)
+    - returns the mean latency per call in microseconds
+    """
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_pk_lookup(sizes=(1_000, 10_000, 100_000, 500_000), repeat=2_000):
+    """
+    - per-op latency of the id based operations of EmpDb as the row count grows
+    - the numbers should stay flat across sizes
+    """
+    print(f"{'rows':>10} {'id_exists':>12} {'insert':>12} {'update':>12} {'delete':>12}  (us/op)")
+    for size in sizes:
+        db = EmpDb(dbName=None)
+        for i in range(size):
+            db.insert_student(str(i), f'Name{i}', 'BS CoE', 'Male', 'Enrolled')
+
+        exists = timed(lambda i: db.id_exists(str(i * 7 % size)), repeat)
+        insert = timed(lambda i: db.insert_student(f'n{i}', 'New Name', 'BS EE', 'Female', 'Enrolled'), repeat)
+        update = timed(lambda i: db.update_student(f'u{i}', 'Upd Name', 'BS ECE', 'Male', 'Not Enrolled', f'n{i}'), repeat)
+        delete = timed(lambda i: db.delete_student(f'u{i}'), repeat)
+        print(f"{size:>10} {exists:>12.2f} {insert:>12.2f} {update:>12.2f} {delete:>12.2f}")
+
+
+def bench_find(sizes=(10_000, 100_000, 500_000), repeat=20):
+    """
+    - find_students() on the secondary indexes against a Python scan of fetch_students()
+    - the selective query matches about 1% of the rows
+    """
+    programs = ('BS CoE', 'BS ECE', 'BS EE')
+    statuses = ('Enrolled', 'Not Enrolled', 'Graduated', 'LOA')
+    print(f"{'rows':>10} {'scan':>12} {'find':>12}  (ms/query)")
+    for size in sizes:
+        db = EmpDb(dbName=None)
+        for i in range(size):
+            db.insert_student(str(i), f'Name{i}', programs[i % 3], ('Male', 'Female')[i % 2], statuses[i % 4] if i % 25 else 'Dropped')
+
+        scan = timed(lambda i: [row for row in db.fetch_students() if row[2] == 'BS CoE' and row[4] == 'Dropped'], repeat)
+        find = timed(lambda i: db.find_students(program='BS CoE', status='Dropped'), repeat)
+        print(f"{size:>10} {scan / 1000:>12.3f} {find / 1000:>12.3f}")
+
+
+def csv_rows(size):
+    """
+    - yields 'size' rows parsed by csv.reader, so every field is a separate string object
+      just like the rows read by import_csv()
+    """
+    programs = ('BS CoE', 'BS ECE', 'BS EE')
+    statuses = ('Enrolled', 'Not Enrolled')
+    lines = (f"{i},Name{i} Surname{i},{programs[i % 3]},{('Male', 'Female')[i % 2]},{statuses[i % 2]}" for i in range(size))
+    return csv.reader(lines)
+
+
+def bench_storage_memory(sizes=(100_000, 1_000_000)):
+    """
+    - memory held by the 'rows' and 'columnar' storage engines of EmpDb
+    - secondary and name indexes are disabled so only the storage itself is measured
+    """
+    print(f"{'rows':>10} {'storage':>10} {'MB':>10} {'bytes/row':>10}")
+    for size in sizes:
+        for storage in ('rows', 'columnar'):
+            tracemalloc.start()
+            db = EmpDb(dbName=None, indexes=(), storage=storage, nameIndex=False)
+            for row in csv_rows(size):
+                db.insert_student(*row)
+            used = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del db
+            print(f"{size:>10} {storage:>10} {used / 2**20:>10.1f} {used / size:>10.1f}")
+
+
+def bench_fetch(size=200_000, repeat=10):
+    """
+    - time and newly allocated memory of a repeated full-table fetch_students()
+    - the 'rows' engine hands out cached tuples, 'columnar' decodes every row
+    """
+    print(f"{'storage':>10} {'ms/fetch':>10} {'KB alloc/fetch':>15}")
+    for storage in ('rows', 'columnar'):
+        db = EmpDb(dbName=None, indexes=(), storage=storage)
+        for row in csv_rows(size):
+            db.insert_student(*row)
+        db.fetch_students()
+
+        elapsed = timed(lambda i: db.fetch_students(), repeat)
+        tracemalloc.start()
+        rows = db.fetch_students()
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del rows
+        print(f"{storage:>10} {elapsed / 1000:>10.2f} {allocated / 1024:>15.1f}")
+
+
+def bench_persist(sizes=(10_000, 100_000), repeat=200):
+    """
+    - cost of persisting one edit : appending to the change log against rewriting the file with export_csv()
+    """
+    print(f"{'rows':>10} {'log append':>12} {'export_csv':>12}  (ms/edit)")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            db = EmpDb(dbName=os.path.join(tmpDir, 'EmpDb.csv'))
+            db.CHECKPOINT_RECORDS = size * 10
+            for row in csv_rows(size):
+                db.insert_student(*row)
+
+            logged = timed(lambda i: db.update_student(str(i), f'Name{i}', 'BS EE', 'Female', 'Enrolled', str(i)), repeat)
+            rewrite = timed(lambda i: db.export_csv(), max(1, repeat // 20))
+            db.close()
+        print(f"{size:>10} {logged / 1000:>12.3f} {rewrite / 1000:>12.3f}")
+
+
+def bench_import(size=200_000, chunkSizes=(1_000, 10_000, 100_000)):
+    """
+    - rows/sec of import_csv() against the old per-row insert_student() path, with the change log enabled
+    - 'transient MB' is the peak memory above the final table size, it follows the chunk size
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        filePath = os.path.join(tmpDir, 'import.csv')
+        with open(filePath, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(EmpDb.FIELDS)
+            writer.writerows(csv_rows(size))
+
+        print(f"{'path':>16} {'rows/sec':>12} {'transient MB':>14}")
+        runs = [('per-row', None)] + [(f'chunk {chunkSize}', chunkSize) for chunkSize in chunkSizes]
+        for run, (label, chunkSize) in enumerate(runs):
+            db = EmpDb(dbName=os.path.join(tmpDir, f'EmpDb{run}.csv'))
+            db.CHECKPOINT_RECORDS = size * 10
+            tracemalloc.start()
+            start = time.perf_counter()
+            if chunkSize is None:
+                with open(filePath, newline='') as csvfile:
+                    reader = csv.reader(csvfile)
+                    next(reader)
+                    for row in reader:
+                        db.insert_student(row[0], row[1], row[2], row[3], row[4])
+            else:
+                db.import_csv(filePath, chunkSize=chunkSize)
+            elapsed = time.perf_counter() - start
+            used, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            db.close()
+            print(f"{label:>16} {size / elapsed:>12.0f} {(peak - used) / 2**20:>14.1f}")
+
+
+def bench_export(sizes=(100_000, 1_000_000)):
+    """
+    - time and peak memory of the streaming exporters, the peak should not grow with the row count
+    - 'json.dump list' is the previous export_json, which built the full list of dicts first
+    """
+    print(f"{'rows':>10} {'export':>16} {'sec':>8} {'peak MB':>10}")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for size in sizes:
+            db = EmpDb(dbName=None, indexes=())
+            db.insert_many(csv_rows(size))
+
+            def json_dump_list():
+                with open(os.path.join(tmpDir, 'old.json'), 'w') as f:
+                    json.dump([dict(zip(EmpDb.FIELDS, row)) for row in db.iter_students()], f, indent=4)
+
+            exports = [
+                ('csv', lambda: db.export_csv(os.path.join(tmpDir, 'out.csv'))),
+                ('csv gzip', lambda: db.export_csv(os.path.join(tmpDir, 'out.csv.gz'), compression='gzip')),
+                ('json', lambda: db.export_json(os.path.join(tmpDir, 'out.json'))),
+                ('json lzma', lambda: db.export_json(os.path.join(tmpDir, 'out.json.xz'), compression='lzma')),
+                ('json.dump list', json_dump_list),
+            ]
+            for label, export in exports:
+                tracemalloc.start()
+                start = time.perf_counter()
+                export()
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{size:>10} {label:>16} {elapsed:>8.2f} {peak / 2**20:>10.2f}")
+
+
+def bench_delta(sizes=(100_000, 1_000_000), changed=100):
+    """
+    - nightly export after 'changed' edits : full export_csv against export_delta and the no-op export
+    """
+    print(f"{'rows':>10} {'full':>10} {'delta':>10} {'no-op':>10}  (ms)")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for size in sizes:
+            db = EmpDb(dbName=None, indexes=())
+            db.insert_many(csv_rows(size))
+            fullFile = os.path.join(tmpDir, 'full.csv')
+            since = db.export_delta(os.path.join(tmpDir, 'delta.csv'))
+            for i in range(changed):
+                db.update_student(str(i * 7), 'Changed Name', 'BS EE', 'Female', 'Enrolled', str(i * 7))
+
+            full = timed(lambda i: db.export_csv(fullFile), 1)
+            db.export_csv(os.path.join(tmpDir, 'full2.csv'))
+            delta = timed(lambda i: db.export_delta(os.path.join(tmpDir, 'delta.csv'), since), 1)
+            noop = timed(lambda i: db.export_csv(os.path.join(tmpDir, 'full2.csv')), 1)
+            print(f"{size:>10} {full / 1000:>10.2f} {delta / 1000:>10.2f} {noop / 1000:>10.3f}")
+
+
+def bench_snapshot(size=100_000, repeat=20):
+    """
+    - fetch_students() right after a change (rebuild) against an unchanged version (cached snapshot)
+    """
+    print(f"{'backend':>12} {'rebuild':>10} {'cached':>10}  (ms/fetch)")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        sqliteDb = EmpDbSqlite(dbName=os.path.join(tmpDir, 'EmpDbSql.db'))
+        sqliteDb.insert_many(csv_rows(size))
+        memoryDb = EmpDb(dbName=None)
+        memoryDb.insert_many(csv_rows(size))
+
+        backends = (
+            ('EmpDb', memoryDb, lambda i: memoryDb.update_student('1', 'Name1', 'BS EE', 'Male', 'Enrolled', '1')),
+            ('EmpDbSqlite', sqliteDb, lambda i: sqliteDb.update_student('Name1', 'BS EE', 'Male', 'Enrolled', '1')),
+        )
+        for label, db, change in backends:
+            def changed_fetch(i):
+                change(i)
+                db.fetch_students()
+
+            rebuild = timed(changed_fetch, repeat)
+            cached = timed(lambda i: db.fetch_students(), repeat)
+            print(f"{label:>12} {rebuild / 1000:>10.2f} {cached / 1000:>10.4f}")
+
+
+def bench_name_prefix(sizes=(100_000, 1_000_000), repeat=1_000):
+    """
+    - search_by_name_prefix() latency for keystroke-sized prefixes, and name index maintenance per update
+    """
+    print(f"{'rows':>10} {'1 char':>10} {'3 chars':>10} {'6 chars':>10} {'update':>10}  (us/op)")
+    for size in sizes:
+        db = EmpDb(dbName=None, indexes=())
+        db.insert_many(csv_rows(size))
+        one = timed(lambda i: db.search_by_name_prefix('n', 10), repeat)
+        three = timed(lambda i: db.search_by_name_prefix('NAM', 10), repeat)
+        six = timed(lambda i: db.search_by_name_prefix(f'name{i % 100}', 10), repeat)
+        update = timed(lambda i: db.update_student(str(i), f'Renamed{i}', 'BS CoE', 'Male', 'Enrolled', str(i)), repeat)
+        print(f"{size:>10} {one:>10.2f} {three:>10.2f} {six:>10.2f} {update:>10.2f}")
+
+
+def bench_sqlite_connections(size=10_000, repeat=2_000):
+    """
+    - ops/sec of EmpDbSqlite with long-lived connections against opening a connection per call
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        dbName = os.path.join(tmpDir, 'EmpDbSql.db')
+        db = EmpDbSqlite(dbName=dbName)
+        db.insert_many(csv_rows(size))
+
+        def per_call(sql, params, commit=False):
+            conn = sqlite3.connect(dbName)
+            result = conn.execute(sql, params).fetchall()
+            if commit:
+                conn.commit()
+            conn.close()
+            return result
+
+        ops = [
+            ('id_exists', lambda i: per_call('SELECT COUNT(*) FROM Students WHERE id = ?', (str(i),)),
+                          lambda i: db.id_exists(str(i))),
+            ('update', lambda i: per_call('UPDATE Students SET name=? WHERE id=?', (f'A{i}', str(i)), commit=True),
+                       lambda i: db.update_student(f'B{i}', 'BS CoE', 'Male', 'Enrolled', str(i))),
+        ]
+        print(f"{'op':>10} {'per-call':>12} {'persistent':>12}  (ops/sec)")
+        for label, old, new in ops:
+            count = repeat if label == 'id_exists' else repeat // 10
+            oldRate = 1e6 / timed(old, count)
+            newRate = 1e6 / timed(new, count)
+            print(f"{label:>10} {oldRate:>12.0f} {newRate:>12.0f}")
+        db.close()
+
+
+def bench_sqlite_import(perRowSize=2_000, size=200_000, batchSizes=(1_000, 10_000, None)):
+    """
+    - rows/sec of EmpDbSqlite imports : one transaction per row against executemany batches
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        filePath = os.path.join(tmpDir, 'import.csv')
+        with open(filePath, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(EmpDb.FIELDS)
+            writer.writerows(csv_rows(size))
+
+        print(f"{'path':>16} {'rows':>10} {'rows/sec':>12}")
+        db = EmpDbSqlite(dbName=os.path.join(tmpDir, 'perrow.db'))
+        start = time.perf_counter()
+        for row in csv_rows(perRowSize):
+            db.insert_student(*row)
+        print(f"{'per-row':>16} {perRowSize:>10} {perRowSize / (time.perf_counter() - start):>12.0f}")
+        db.close()
+
+        for run, batchSize in enumerate(batchSizes):
+            db = EmpDbSqlite(dbName=os.path.join(tmpDir, f'batch{run}.db'))
+            if batchSize is None:
+                start = time.perf_counter()
+                with open(filePath, newline='') as csvfile:
+                    reader = csv.reader(csvfile)
+                    next(reader)
+                    rows = db.insert_many(reader)
+                rate = rows / (time.perf_counter() - start)
+                label = 'one transaction'
+            else:
+                stats = db.import_csv(filePath, batchSize=batchSize)
+                rows, rate = stats['rows'], stats['rowsPerSec']
+                label = f'batch {batchSize}'
+            print(f"{label:>16} {rows:>10} {rate:>12.0f}")
+            db.close()
+
+
+def bench_sqlite_profiles(size=200_000, commits=1_000, lookups=20_000):
+    """
+    - EmpDbSqlite PRAGMA presets : single-row commits/sec, bulk insert rows/sec, id lookups/sec and full scan time
+    """
+    print(f"{'profile':>10} {'commits/s':>10} {'bulk rows/s':>12} {'lookups/s':>10} {'scan ms':>8}")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for profile in (None, 'durable', 'balanced', 'bulk-load'):
+            db = EmpDbSqlite(dbName=os.path.join(tmpDir, f'{profile}.db'), profile=profile)
+            commitRate = 1e6 / timed(lambda i: db.insert_student(f'c{i}', f'Name{i}', 'BS CoE', 'Male', 'Enrolled'), commits)
+            start = time.perf_counter()
+            db.insert_many(csv_rows(size))
+            bulkRate = size / (time.perf_counter() - start)
+            lookupRate = 1e6 / timed(lambda i: db.id_exists(str(i * 7 % size)), lookups)
+            scan = timed(lambda i: db.cursor.execute("SELECT COUNT(*) FROM Students WHERE name LIKE '%9 Surname1%'").fetchone(), 5)
+            print(f"{str(profile):>10} {commitRate:>10.0f} {bulkRate:>12.0f} {lookupRate:>10.0f} {scan / 1000:>8.1f}")
+            db.close()
+
+
+def bench_sqlite_pages(size=500_000, limit=50, repeat=50):
+    """
+    - cost of one page of EmpDbSqlite rows at increasing depth : LIMIT/OFFSET against fetch_page() keyset pagination
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        db = EmpDbSqlite(dbName=os.path.join(tmpDir, 'EmpDbSql.db'))
+        db.insert_many(csv_rows(size))
+        byId = [row[0] for row in db.cursor.execute('SELECT id FROM Students ORDER BY id')]
+        byName = [row[0] for row in db.cursor.execute('SELECT id FROM Students ORDER BY name, id')]
+
+        print(f"{'page row':>10} {'offset id':>10} {'keyset id':>10} {'offset name':>12} {'keyset name':>12}  (ms/page)")
+        for depth in (0, size // 10, size // 2, size - limit):
+            afterId = byId[depth - 1] if depth else None
+            afterName = byName[depth - 1] if depth else None
+            offsetId = timed(lambda i: db.cursor.execute('SELECT * FROM Students ORDER BY id LIMIT ? OFFSET ?', (limit, depth)).fetchall(), repeat)
+            keysetId = timed(lambda i: db.fetch_page(afterId, limit, 'id'), repeat)
+            offsetName = timed(lambda i: db.cursor.execute('SELECT * FROM Students ORDER BY name, id LIMIT ? OFFSET ?', (limit, depth)).fetchall(), repeat)
+            keysetName = timed(lambda i: db.fetch_page(afterName, limit, 'name'), repeat)
+            print(f"{depth:>10} {offsetId / 1000:>10.3f} {keysetId / 1000:>10.3f} {offsetName / 1000:>12.3f} {keysetName / 1000:>12.3f}")
+        db.close()
+
+
+def bench_sqlite_counts(size=1_000_000, repeat=5):
+    """
+    - dashboard numbers on EmpDbSqlite : count_by()/count_where() in SQLite against fetch_students() and counting in Python
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        db = EmpDbSqlite(dbName=os.path.join(tmpDir, 'EmpDbSql.db'))
+        db.insert_many(csv_rows(size))
+
+        def python_count(i):
+            db.snapshotVersion = None
+            counts = {}
+            for row in db.fetch_students():
+                counts[row[2]] = counts.get(row[2], 0) + 1
+            return counts
+
+        print(f"{'query':>28} {'ms':>10}")
+        print(f"{'fetch + count in Python':>28} {timed(python_count, 1) / 1000:>10.2f}")
+        print(f"{'count_by program':>28} {timed(lambda i: db.count_by('program'), repeat) / 1000:>10.2f}")
+        print(f"{'count_by status, program=':>28} {timed(lambda i: db.count_by('status', program='BS EE'), repeat) / 1000:>10.2f}")
+        print(f"{'count_where program, status':>28} {timed(lambda i: db.count_where(program='BS EE', status='Enrolled'), repeat) / 1000:>10.2f}")
+        db.close()
+
+
+def bench_sqlite_search(size=1_000_000, repeat=20):
+    """
+    - name search on EmpDbSqlite : LIKE '%x%' table scan against the FTS5 index of search_students()
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        db = EmpDbSqlite(dbName=os.path.join(tmpDir, 'EmpDbSql.db'))
+        db.insert_many(csv_rows(size))
+        name = db.fetch_page(after_id=str(size // 2), limit=1)[0][1]
+
+        def like(i):
+            return db.cursor.execute('SELECT * FROM Students WHERE name LIKE ? LIMIT 20', (f'%{name}%',)).fetchall()
+
+        print(f"{'query':>20} {'ms':>10}")
+        print(f"{'LIKE %name%':>20} {timed(like, repeat) / 1000:>10.2f}")
+        print(f"{'search_students':>20} {timed(lambda i: db.search_students(name), repeat) / 1000:>10.2f}")
+        # the first word minus its last digit matches about ten names
+        prefix = name.split()[0][:-1]
+        print(f"{'search prefix':>20} {timed(lambda i: db.search_students(prefix), repeat) / 1000:>10.2f}")
+        db.close()
+
+
+def bench_sqlite_async(size=2_000):
+    """
+    - event loop stalls while 'size' inserts run : direct EmpDbSqlite calls against AsyncEmpDbSqlite
+    - a ticker coroutine sleeps 1 ms in a loop, its longest gap is the worst freeze a GUI would see
+    """
+    async def ticker(stop, gaps):
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    async def run(insert):
+        stop, gaps = asyncio.Event(), []
+        tick = asyncio.create_task(ticker(stop, gaps))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await insert()
+        seconds = time.perf_counter() - start
+        stop.set()
+        await tick
+        return size / seconds, max(gaps) * 1000
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        db = EmpDbSqlite(dbName=os.path.join(tmpDir, 'direct.db'), profile='durable')
+
+        async def direct():
+            for i in range(size):
+                db.insert_student(str(i), f'Name{i}', 'BS CoE', 'Male', 'Enrolled')
+
+        asyncDb = AsyncEmpDbSqlite(dbName=os.path.join(tmpDir, 'async.db'), profile='durable')
+
+        async def pipelined():
+            await asyncio.gather(*(asyncDb.insert_student(str(i), f'Name{i}', 'BS CoE', 'Male', 'Enrolled')
+                                   for i in range(size)))
+
+        print(f"{'calls':>10} {'rows/s':>10} {'max stall ms':>14}")
+        for label, insert in (('direct', direct), ('async', pipelined)):
+            rowsPerSec, stall = asyncio.run(run(insert))
+            print(f"{label:>10} {rowsPerSec:>10.0f} {stall:>14.2f}")
+        db.close()
+        asyncDb.shutdown()
+
+
+def bench_sqlite_group_commit(size=2_000, groupCommits=(None, (10, 0.02), (50, 0.02), (200, 0.02))):
+    """
+    - insert_student() throughput with the durable profile, one commit per mutation against group commit
+    - maxLag is the longest a mutation stayed uncommitted, the worst-case durability lag
+    """
+    print(f"{'groupCommit':>14} {'rows/s':>10} {'commits':>8} {'maxLag ms':>10}")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for n, groupCommit in enumerate(groupCommits):
+            db = EmpDbSqlite(dbName=os.path.join(tmpDir, f'EmpDbSql{n}.db'), profile='durable', groupCommit=groupCommit)
+            commits = db.commitStats['commits']
+            start = time.perf_counter()
+            for i in range(size):
+                db.insert_student(str(i), f'Name{i}', 'BS CoE', 'Male', 'Enrolled')
+            db.flush()
+            seconds = time.perf_counter() - start
+            print(f"{str(groupCommit):>14} {size / seconds:>10.0f} {db.commitStats['commits'] - commits:>8} "
+                  f"{db.commitStats['maxLag'] * 1000:>10.2f}")
+            db.close()
+
+
+def bench_sqlite_export(sizes=(100_000, 1_000_000)):
+    """
+    - time and peak Python memory of the streaming EmpDbSqlite exporters, the peak should not grow with the row count
+    - 'fetch + write' is the previous export_csv, which loaded every row with fetch_students() first
+    """
+    print(f"{'rows':>10} {'export':>16} {'sec':>8} {'peak MB':>10}")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for size in sizes:
+            db = EmpDbSqlite(dbName=os.path.join(tmpDir, f'EmpDbSql{size}.db'))
+            db.insert_many(csv_rows(size))
+
+            def fetch_write():
+                db.snapshotVersion = None
+                with open(os.path.join(tmpDir, 'old.csv'), 'w') as filehandle:
+                    for entry in db.fetch_students():
+                        filehandle.write(f"{entry[0]},{entry[1]},{entry[2]},{entry[3]},{entry[4]}\n")
+
+            exports = [
+                ('fetch + write', fetch_write),
+                ('csv', lambda: db.export_csv(os.path.join(tmpDir, 'out.csv'))),
+                ('csv gzip', lambda: db.export_csv(os.path.join(tmpDir, 'out.csv.gz'), compression='gzip')),
+                ('json', lambda: db.export_json(os.path.join(tmpDir, 'out.json'))),
+            ]
+            for label, export in exports:
+                tracemalloc.start()
+                start = time.perf_counter()
+                export()
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{size:>10} {label:>16} {elapsed:>8.2f} {peak / 2**20:>10.2f}")
+            db.close()
+
+
+def bench_sqlite_backup(size=200_000, pagesPerStep=(None, 4096), interval=0.02):
+    """
+    - online backup of a live EmpDbSqlite while another connection inserts a row every 'interval' seconds
+    - the default pages_per_step copies a WAL database in one step, which only holds a read lock,
+      a stepped copy is restarted by every write of the other connection
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        dbName = os.path.join(tmpDir, 'EmpDbSql.db')
+        db = EmpDbSqlite(dbName=dbName)
+        db.insert_many(csv_rows(size))
+
+        print(f"{'pages/step':>10} {'sec':>8} {'steps':>8} {'inserts':>8} {'max insert ms':>14}")
+        for pages in pagesPerStep:
+            stop = threading.Event()
+            latencies = []
+
+            def writer():
+                other = sqlite3.connect(dbName, timeout=30)
+                i = 0
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    other.execute("INSERT INTO Students VALUES (?, 'Writer', 'BS EE', 'Female', 'Enrolled')", (f'w{pages}-{i}',))
+                    other.commit()
+                    latencies.append(time.perf_counter() - start)
+                    i += 1
+                    time.sleep(interval)
+                other.close()
+
+            steps = []
+            thread = threading.Thread(target=writer)
+            thread.start()
+            stats = db.backup(os.path.join(tmpDir, 'backup.db'), pages_per_step=pages, progress=lambda *args: steps.append(args))
+            stop.set()
+            thread.join()
+            print(f"{str(pages):>10} {stats['seconds']:>8.2f} {len(steps):>8} {len(latencies):>8} {max(latencies) * 1000:>14.2f}")
+
+        start = time.perf_counter()
+        memory = db.snapshot_to_memory()
+        print(f"snapshot_to_memory {time.perf_counter() - start:.2f} s")
+        memory.close()
+        db.close()
+
+
+def bench_sqlite_cache(size=1_000_000, checks=100_000, overlap=0.1):
+    """
+    - duplicate checks of an import feed, 'overlap' of its ids already exist, without and with the cache
+    - id_exists() checks the ids one by one, existing_ids() checks batches of 10000
+    - the Bloom filter is built once before the timed runs, its build time is printed separately
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        dbName = os.path.join(tmpDir, 'EmpDbSql.db')
+        db = EmpDbSqlite(dbName=dbName)
+        db.insert_many(csv_rows(size))
+        db.close()
+        existing = int(checks * overlap)
+        ids = [str(i * 7 % size) for i in range(existing)] + [f'new{i}' for i in range(checks - existing)]
+
+        def one_by_one(db):
+            for id in ids:
+                db.id_exists(id)
+
+        def batched(db):
+            for start in range(0, checks, 10_000):
+                db.existing_ids(ids[start:start + 10_000])
+
+        print(f"{'cache':>10} {'check':>12} {'us/check':>10} {'bloom':>8} {'false +':>8}")
+        for cacheSize in (None, 10_000):
+            db = EmpDbSqlite(dbName=dbName, cacheSize=cacheSize)
+            if db.cache is not None:
+                start = time.perf_counter()
+                db.sync_version()
+                db.build_bloom()
+                print(f"Bloom filter of {size} ids built in {time.perf_counter() - start:.2f} s")
+            for label, check in (('id_exists', one_by_one), ('existing_ids', batched)):
+                stats = dict(db.cache.stats) if db.cache is not None else None
+                start = time.perf_counter()
+                check(db)
+                seconds = time.perf_counter() - start
+                if stats is None:
+                    bloom = falsePositives = '-'
+                else:
+                    bloom = db.cache.stats['bloomNegatives'] - stats['bloomNegatives']
+                    falsePositives = db.cache.stats['falsePositives'] - stats['falsePositives']
+                print(f"{str(cacheSize):>10} {label:>12} {seconds / checks * 1e6:>10.2f} {bloom:>8} {falsePositives:>8}")
+            db.close()
+
+
+def bench_sqlite_merge(size=1_000_000, feedSize=10_000):
+    """
+    - applying a daily feed of 'feedSize' rows, half updates and half new ids, to a table of 'size' rows
+    - merge import with each policy against the delete-everything-and-reimport workaround
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fullPath = os.path.join(tmpDir, 'full.csv')
+        feedPath = os.path.join(tmpDir, 'feed.csv')
+        with open(fullPath, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(EmpDb.FIELDS)
+            writer.writerows(csv_rows(size + feedSize // 2))
+        with open(feedPath, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(EmpDb.FIELDS + ('version',))
+            for i in range(size - feedSize // 2, size + feedSize // 2):
+                writer.writerow((str(i), f'Feed{i}', 'BS EE', 'Female', 'Enrolled', 1))
+
+        print(f"{'apply feed':>16} {'sec':>8} {'inserted':>10} {'updated':>10} {'skipped':>10}")
+        for policy in EmpDbSqlite.MERGE_POLICIES:
+            db = EmpDbSqlite(dbName=os.path.join(tmpDir, f'{policy}.db'))
+            db.insert_many(csv_rows(size))
+            stats = db.import_csv(feedPath, policy=policy)
+            print(f"{policy:>16} {stats['seconds']:>8.2f} {stats['inserted']:>10} {stats['updated']:>10} {stats['skipped']:>10}")
+            db.close()
+
+        db = EmpDbSqlite(dbName=os.path.join(tmpDir, 'reimport.db'))
+        db.insert_many(csv_rows(size))
+        start = time.perf_counter()
+        db.cursor.execute('DELETE FROM Students')
+        db.commit_close()
+        stats = db.import_csv(fullPath)
+        print(f"{'delete+reimport':>16} {time.perf_counter() - start:>8.2f} {stats['inserted']:>10} {'-':>10} {'-':>10}")
+        db.close()
+
+
+def bench_sqlite_schema(size=5_000_000, lookups=10_000):
+    """
+    - schema 1 against schema 2 with TEXT and INTEGER ids : load time, file size, full scan, counts and id lookups
+    - also times migrate() of the schema 1 database
+    """
+    with tempfile.TemporaryDirectory() as tmpDir:
+        print(f"{'schema':>12} {'load s':>8} {'MB':>8} {'scan s':>8} {'raw scan s':>10} {'count_by ms':>12} {'lookup us':>10}")
+        for label, schema, integerIds in (('1', 1, False), ('2 text id', 2, False), ('2 int id', 2, True)):
+            dbName = os.path.join(tmpDir, f'schema{label}.db'.replace(' ', ''))
+            db = EmpDbSqlite(dbName=dbName, profile='bulk-load', schema=schema, integerIds=integerIds)
+            start = time.perf_counter()
+            db.insert_many(csv_rows(size), batchSize=100_000)
+            load = time.perf_counter() - start
+            db.cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            megabytes = os.path.getsize(dbName) / 2**20
+
+            start = time.perf_counter()
+            for row in db.iter_students(batch_size=10_000):
+                pass
+            scan = time.perf_counter() - start
+            # the table alone, without decoding the codes
+            start = time.perf_counter()
+            db.cursor.execute(f'SELECT * FROM {db.rowsTable}').fetchall()
+            rawScan = time.perf_counter() - start
+            countBy = timed(lambda i: db.count_by('program'), 5) / 1000
+            lookup = timed(lambda i: db.get_student(str(i * 7919 % size)), lookups)
+            print(f"{label:>12} {load:>8.1f} {megabytes:>8.1f} {scan:>8.2f} {rawScan:>10.2f} {countBy:>12.1f} {lookup:>10.2f}")
+            db.close()
+
+        db = EmpDbSqlite(dbName=os.path.join(tmpDir, 'schema1.db'), profile='bulk-load')
+        stats = db.migrate()
+        print(f"migrate {stats['rows']} rows : {stats['seconds']:.1f} s, "
+              f"{stats['bytes'][0] / 2**20:.1f} MB -> {stats['bytes'][1] / 2**20:.1f} MB")
+        db.close()
+
+
+def bench_table_scroll(sizes=(100, 1_000_000), window=55, repeat=200):
+    """
+    - reads made by EmpGuiTable : the rows of a whole window after a jump of the scrollbar,
+      and the 5 rows scrolled into it by a mouse wheel step, for both backends at increasing sizes
+    """
+    print(f"{'backend':>8} {'rows':>10} {'jump ms':>8} {'wheel us':>9}")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for size in sizes:
+            memory = EmpDb(dbName=None)
+            memory.insert_many(csv_rows(size))
+            sqliteDb = EmpDbSqlite(dbName=os.path.join(tmpDir, f'EmpDbSql{size}.db'))
+            sqliteDb.insert_many(csv_rows(size))
+            for name, db in (('EmpDb', memory), ('sqlite', sqliteDb)):
+                # every jump lands on a position no earlier read started near
+                jump = timed(lambda i: db.fetch_range((i * 7919 * size // repeat) % size, window), repeat) / 1000
+                db.fetch_range(size // 2, window)
+                wheel = timed(lambda i: db.fetch_range(size // 2 + window + 5 * i, 5), repeat)
+                print(f"{name:>8} {size:>10} {jump:>8.3f} {wheel:>9.1f}")
+            sqliteDb.close()
+
+
+def main():
+    bench_pk_lookup()
+    bench_find()
+    bench_storage_memory()
+    bench_fetch()
+    bench_persist()
+    bench_import()
+    bench_export()
+    bench_delta()
+    bench_snapshot()
+    bench_name_prefix()
+    bench_sqlite_connections()
+    bench_sqlite_import()
+    bench_sqlite_profiles()
+    bench_sqlite_pages()
+    bench_sqlite_counts()
+    bench_sqlite_search()
+    bench_sqlite_async()
+    bench_sqlite_group_commit()
+    bench_sqlite_export()
+    bench_sqlite_backup()
+    bench_sqlite_cache()
+    bench_sqlite_merge()
+    bench_sqlite_schema()
+    bench_table_scroll()
+
+
+if __name__ == "__main__":
+    main()
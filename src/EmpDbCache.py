@@ -0,0 +1,221 @@
+'''
+Read-through cache used by EmpDbSqlite
+- an LRU of id -> row for the most recently read rows
+- a Bloom filter over every id, so most checks for a missing id are answered without a query
+- ids are compared as strings, the Students.id column has TEXT affinity
+'''
+
+import math
+import threading
+from collections import OrderedDict
+
+
+class BloomFilter:
+    """
+    - set membership with false positives but no false negatives
+    - sized for 'capacity' keys at about the false positive rate 'errorRate'
+    - blocked layout : a key sets 7 bits inside one 64-bit block picked by its hash,
+      so a check is one hash and one block test instead of 7 separate bit lookups
+    """
+
+    def __init__(self, capacity, errorRate=0.01):
+        self.capacity = max(capacity, 1)
+        bits = int(-self.capacity * math.log(errorRate) / math.log(2) ** 2)
+        self.blocks = [0] * max(1, (bits + 63) // 64)
+        # number of keys added, the error rate grows past capacity
+        self.count = 0
+
+    def locate(self, key):
+        # returns (block, mask), the hash of a str is stable for the life of the process
+        h = hash(key)
+        g = h >> 32
+        return h % len(self.blocks), ((1 << (g & 63)) | (1 << ((g >> 6) & 63)) | (1 << ((g >> 12) & 63)) |
+                                      (1 << ((g >> 18) & 63)) | (1 << ((g >> 24) & 63)) |
+                                      (1 << ((h >> 8) & 63)) | (1 << ((h >> 14) & 63)))
+
+    def add(self, key):
+        block, mask = self.locate(key)
+        self.blocks[block] |= mask
+        self.count += 1
+
+    def __contains__(self, key):
+        block, mask = self.locate(key)
+        return self.blocks[block] & mask == mask
+
+
+class EmpDbCache:
+    """
+    - holds at most 'size' rows, the least recently used one is dropped first
+    - the Bloom filter is built by the database with build() and only ever grows,
+      a deleted id stays in it and costs one query when checked
+    - after a commit by another connection the database drops the rows with drop_rows() and adds the ids
+      inserted since the filter was filled with catch_up(), the filter is only built again when those are unknown
+    - every method takes the lock, the cache is shared by all threads of the database
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.rows = OrderedDict()
+        self.bloom = None
+        # (rowid, id) of the last row of the table when the filter was filled, the rows after it are newer
+        self.mark = None
+        # ids inserted while a Bloom filter is being built, and the clear() count that build started at
+        self.building = None
+        self.cleared = 0
+        self.lock = threading.Lock()
+        # hits and misses of the LRU, checks answered by the Bloom filter alone,
+        # and Bloom filter matches for ids that turned out to be missing
+        self.stats = {'hits': 0, 'misses': 0, 'bloomNegatives': 0, 'falsePositives': 0}
+
+    def get(self, id):
+        """
+        - returns the cached row of 'id' or None
+        """
+        with self.lock:
+            row = self.rows.get(str(id))
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.rows.move_to_end(str(id))
+            self.stats['hits'] += 1
+            return row
+
+    def put(self, row):
+        """
+        - caches 'row', a row read from the database
+        - no return value
+        """
+        with self.lock:
+            self.rows[str(row[0])] = row
+            self.rows.move_to_end(str(row[0]))
+            if len(self.rows) > self.size:
+                self.rows.popitem(last=False)
+
+    def discard(self, id):
+        """
+        - drops the cached row of 'id' after it was written
+        - no return value
+        """
+        with self.lock:
+            self.rows.pop(str(id), None)
+
+    def add_id(self, id):
+        """
+        - records an inserted id in the Bloom filter, drops the filter once it is over capacity
+        - no return value
+        """
+        with self.lock:
+            self.rows.pop(str(id), None)
+            if self.building is not None:
+                self.building.append(str(id))
+            if self.bloom is None:
+                return
+            self.bloom.add(str(id))
+            if self.bloom.count > self.bloom.capacity:
+                # rebuilt twice as big on the next check
+                self.bloom = None
+
+    def track(self, rows):
+        """
+        - yields 'rows' unchanged, adding every id to the Bloom filter on the way
+        """
+        for row in rows:
+            self.add_id(row[0])
+            yield row
+
+    def start_build(self):
+        """
+        - called before the ids are read for build(), the ids inserted from now on are added to the new filter
+        - returns the token to pass to build()
+        """
+        with self.lock:
+            self.building = []
+            return self.cleared
+
+    def build(self, ids, count, token, mark):
+        """
+        - fills a new Bloom filter with 'ids', sized for twice 'count' so inserts fit before the next rebuild
+        - mark : (rowid, id) of the last row, read before 'ids', or None for an empty table
+        - the filter is dropped if clear() was called since start_build()
+        - no return value
+        """
+        bloom = BloomFilter(max(2 * count, 1024))
+        for id in ids:
+            bloom.add(str(id))
+        with self.lock:
+            if token == self.cleared:
+                for id in self.building:
+                    bloom.add(id)
+                self.bloom = bloom
+                self.mark = mark
+            self.building = None
+
+    def drop_rows(self):
+        """
+        - drops every row, after another connection changed the database, the Bloom filter is kept
+        - returns (filter, mark) to pass to catch_up(), or None if there is no filter to catch up
+        """
+        with self.lock:
+            self.rows.clear()
+            if self.bloom is None:
+                return None
+            return self.bloom, self.mark
+
+    def catch_up(self, ids, bloom, mark):
+        """
+        - adds 'ids', the ids of the rows after the mark returned by drop_rows(), to that filter
+        - mark : (rowid, id) of the last of those rows, or None if there are none
+        - nothing is added if the filter was replaced since drop_rows()
+        - no return value
+        """
+        with self.lock:
+            if self.bloom is not bloom:
+                return
+            for id in map(str, ids):
+                if id not in bloom:
+                    bloom.add(id)
+            if mark is not None and mark[0] > self.mark[0]:
+                self.mark = mark
+            if bloom.count > bloom.capacity:
+                self.bloom = None
+
+    def might_contain(self, id):
+        """
+        - False if 'id' is surely missing, True if it may exist or there is no filter
+        """
+        with self.lock:
+            if self.bloom is None or str(id) in self.bloom:
+                return True
+            self.stats['bloomNegatives'] += 1
+            return False
+
+    def candidates(self, ids):
+        """
+        - returns the ids of 'ids' that may exist, as strings, the others are surely missing
+        """
+        with self.lock:
+            if self.bloom is None:
+                return [str(id) for id in ids]
+            bloom = self.bloom
+            candidates = [id for id in map(str, ids) if id in bloom]
+            self.stats['bloomNegatives'] += len(ids) - len(candidates)
+            return candidates
+
+    def missing(self, count=1):
+        """
+        - records 'count' ids that matched the Bloom filter but are not in the database
+        - no return value
+        """
+        with self.lock:
+            self.stats['falsePositives'] += count
+
+    def clear(self):
+        """
+        - drops every row and the Bloom filter, when the ids inserted by another connection are unknown
+        - no return value
+        """
+        with self.lock:
+            self.rows.clear()
+            self.bloom = None
+            self.mark = None
+            self.cleared += 1
@@ -0,0 +1,78 @@
+'''
+Streaming exporters shared by the database backends
+- rows are written as they come from the iterable, nothing is collected in memory
+- output can be compressed on the fly with gzip or lzma
+'''
+
+import csv
+import gzip
+import json
+import lzma
+
+# file extension added to default output names for each compression
+EXTENSIONS = {None: '', 'gzip': '.gz', 'lzma': '.xz'}
+
+# fields in the order of the row tuples
+FIELDS = ('id', 'name', 'program', 'gender', 'status')
+
+
+def open_output(outputFile, compression=None):
+    """
+    - opens 'outputFile' for writing text
+    - compression : None, 'gzip' or 'lzma'
+    - returns the file object
+    """
+    if compression is None:
+        return open(outputFile, 'w', newline='', encoding='utf-8')
+    if compression == 'gzip':
+        return gzip.open(outputFile, 'wt', newline='', encoding='utf-8')
+    if compression == 'lzma':
+        return lzma.open(outputFile, 'wt', newline='', encoding='utf-8')
+    raise Exception(f"Unknown compression '{compression}'")
+
+
+def write_csv(outputFile, rows, compression=None):
+    """
+    - writes a header and every row of 'rows' as CSV
+    - returns the number of rows written
+    """
+    count = 0
+    with open_output(outputFile, compression) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_delta(outputFile, changes, compression=None):
+    """
+    - writes the (op, row) pairs of 'changes' as CSV, op is 'insert', 'update' or 'delete'
+    - returns the number of changes written
+    """
+    count = 0
+    with open_output(outputFile, compression) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(('op',) + FIELDS)
+        for op, row in changes:
+            writer.writerow((op,) + tuple(row))
+            count += 1
+    return count
+
+
+def write_json(outputFile, rows, compression=None):
+    """
+    - writes the rows as a JSON array of objects, one object per line
+    - the array is written incrementally, the list of records never exists in memory
+    - returns the number of rows written
+    """
+    count = 0
+    with open_output(outputFile, compression) as jsonfile:
+        jsonfile.write('[')
+        for row in rows:
+            jsonfile.write(',\n    ' if count else '\n    ')
+            jsonfile.write(json.dumps(dict(zip(FIELDS, row))))
+            count += 1
+        jsonfile.write('\n]\n' if count else ']\n')
+    return count
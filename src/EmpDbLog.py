@@ -0,0 +1,111 @@
+'''
+Append-only change log used by EmpDb for persistence
+- every change is one JSON line :
+    ["put", id, name, program, gender, status]
+    ["del", id]
+    ["version", version]    first record of every log, the data version of the snapshot
+- replaying the records is idempotent, replaying them on a snapshot that
+  already contains some of them gives the same result
+'''
+
+import json
+import os
+
+
+class EmpDbLog:
+    """
+    - appends change records to 'logName'
+    - rotate() moves the current log aside while a snapshot is written
+    """
+
+    def __init__(self, logName, durable=False):
+        """
+        - logName : path of the log file, the rotated log is logName + '.old'
+        - durable : fsync after every record, otherwise records are only flushed to the OS
+        """
+        self.logName = logName
+        self.oldName = logName + '.old'
+        self.durable = durable
+        self.repair()
+        self.logFile = open(self.logName, 'a', encoding='utf-8')
+        # number of records written since the last rotation
+        self.count = 0
+
+    def repair(self):
+        """
+        - cuts a torn last line left behind by a crash, so new records start on a line of their own
+        - no return value
+        """
+        if not os.path.exists(self.logName):
+            return
+        with open(self.logName, 'rb+') as logFile:
+            end = logFile.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(0, end - 4096)
+                logFile.seek(start)
+                newline = logFile.read(end - start).rfind(b'\n')
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            logFile.truncate(end)
+
+    def append(self, *records):
+        """
+        - writes the records with a single write call and flushes them
+        - no return value
+        """
+        self.logFile.write(''.join(json.dumps(record) + '\n' for record in records))
+        self.logFile.flush()
+        if self.durable:
+            os.fsync(self.logFile.fileno())
+        self.count += len(records)
+
+    def rotate(self):
+        """
+        - renames the current log to oldName and starts a new empty log
+        - the caller removes oldName with discard_old() once the snapshot is safe
+        - no return value
+        """
+        self.logFile.close()
+        os.replace(self.logName, self.oldName)
+        self.logFile = open(self.logName, 'a', encoding='utf-8')
+        self.count = 0
+
+    def discard_old(self):
+        """
+        - removes the rotated log
+        - no return value
+        """
+        if os.path.exists(self.oldName):
+            os.remove(self.oldName)
+
+    def truncate(self):
+        """
+        - drops every record of the current log
+        - no return value
+        """
+        self.logFile.close()
+        self.logFile = open(self.logName, 'w', encoding='utf-8')
+        self.count = 0
+
+    def close(self):
+        self.logFile.close()
+
+    @staticmethod
+    def records(logName):
+        """
+        - yields the records stored in 'logName', oldest first
+        - stops at a torn last line left behind by a crash
+        """
+        if not os.path.exists(logName):
+            return
+        with open(logName, 'r', encoding='utf-8') as logFile:
+            for line in logFile:
+                if not line.endswith('\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                yield record
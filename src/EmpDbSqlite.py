@@ -2,106 +2,918 @@
 This is the interface to an SQLite Database
 '''
 
-import json
 import sqlite3
+import bisect
 import csv
+import itertools
+import os
+import re
+import threading
+import time
+
+import EmpDbExport
+from EmpDbCache import EmpDbCache
 
 class EmpDbSqlite:
-    def __init__(self, dbName='Students.db'):
+    # PRAGMA presets applied to every connection when it is opened
+    # - durable : WAL journal with a sync on every commit, nothing committed is lost on power loss
+    # - balanced : WAL journal synced at checkpoints, a power loss may lose the last commits but never corrupts
+    # - bulk-load : no syncs and the biggest caches, for imports that can be repeated after a crash
+    # None keeps the SQLite defaults (rollback journal, synchronous=FULL)
+    PROFILES = {
+        'durable': {'journal_mode': 'WAL', 'synchronous': 'FULL', 'cache_size': -16000,
+                    'mmap_size': 0, 'temp_store': 'DEFAULT', 'busy_timeout': 5000},
+        'balanced': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -64000,
+                     'mmap_size': 268435456, 'temp_store': 'MEMORY', 'busy_timeout': 5000},
+        'bulk-load': {'journal_mode': 'WAL', 'synchronous': 'OFF', 'cache_size': -256000,
+                      'mmap_size': 1073741824, 'temp_store': 'MEMORY', 'busy_timeout': 5000},
+    }
+
+    # names of the PRAGMA values returned by effective_settings()
+    PRAGMA_VALUES = {
+        'synchronous': {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'},
+        'temp_store': {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'},
+    }
+
+    # id_exists(), get_student() and existing_ids() look for commits of other connections at most this often
+    # per thread, in seconds, with a cache their changes may take that long to show
+    CACHE_SYNC_INTERVAL = 0.05
+
+    # columns of the Students table in the order of the row tuples
+    FIELDS = ('id', 'name', 'program', 'gender', 'status')
+
+    # conflict policies of merge_many() and import_csv(), for rows whose id already exists
+    # - skip : the stored row is kept
+    # - overwrite : the stored row is replaced
+    # - newest : the stored row is replaced if the incoming version is higher than the one recorded for that id
+    MERGE_POLICIES = ('skip', 'overwrite', 'newest')
+
+    # schema 2 lookup tables of the categorical columns, code INTEGER PRIMARY KEY and name TEXT UNIQUE
+    LOOKUPS = {'program': 'Programs', 'gender': 'Genders', 'status': 'Statuses'}
+    # schema 2 : the rows of StudentRows with the codes replaced by their names, the query of the Students view
+    VIEW = '''SELECT StudentRows.id AS id, StudentRows.name AS name,
+                     Programs.name AS program, Genders.name AS gender, Statuses.name AS status
+              FROM StudentRows
+              LEFT JOIN Programs ON Programs.code = StudentRows.program
+              LEFT JOIN Genders ON Genders.code = StudentRows.gender
+              LEFT JOIN Statuses ON Statuses.code = StudentRows.status'''
+
+    def __init__(self, dbName='Students.db', profile='balanced', groupCommit=None, cacheSize=None, schema=1, integerIds=False):
         super().__init__()
         self.dbName = dbName
+        # profile : a name in PROFILES, a dict of the same PRAGMAs, or None for the SQLite defaults
+        if profile is None:
+            self.profile = {}
+        elif isinstance(profile, dict):
+            self.profile = dict(profile)
+        elif profile in self.PROFILES:
+            self.profile = self.PROFILES[profile]
+        else:
+            raise Exception(f"Unknown profile '{profile}'")
+        for pragma, value in self.profile.items():
+            if pragma not in self.PROFILES['balanced'] or not str(value).lstrip('-').isalnum():
+                raise Exception(f"Invalid PRAGMA {pragma} = {value}")
         self.csvFile = self.dbName.replace('.db', '.csv')
-        self.conn = sqlite3.connect(self.dbName)
-        self.cursor = self.conn.cursor()
+        # data version, incremented by every commit made through this object
+        self.version = 0
+        # rows returned by fetch_students() and the version they belong to
+        self.snapshot = None
+        self.snapshotVersion = None
+        # one long-lived connection per thread, all of them are closed by close()
+        self.local = threading.local()
+        self.connections = []
+        self.connectionsLock = threading.Lock()
+        # groupCommit : None commits every mutation, or (maxOps, maxDelay) to leave mutations pending
+        # and commit them together once maxOps are pending or the oldest is maxDelay seconds old
+        # a thread always reads its own pending mutations, other connections see them after the commit
+        self.groupCommit = groupCommit
+        # connection -> (pending mutations, perf_counter() of the oldest), guarded by pendingLock
+        self.pending = {}
+        self.pendingLock = threading.RLock()
+        self.flushTimer = None
+        # commits made, mutations committed and the longest a mutation stayed uncommitted, in seconds
+        self.commitStats = {'commits': 0, 'mutations': 0, 'maxLag': 0.0}
+        # (outputFile, compression) -> version of the last export written there
+        self.exportVersions = {}
+        # positions and ids of the first rows of recent fetch_range() calls, sorted by position,
+        # and the version they belong to
+        self.rangePositions = []
+        self.rangeIds = []
+        self.rangeVersion = None
+        # cacheSize : None reads every row from the database, or the number of rows kept in an LRU cache by id,
+        # id_exists() and get_student() then also check a Bloom filter of the ids before running a query
+        # a commit by another connection empties the LRU and adds the ids it inserted to the Bloom filter
+        self.cache = None if cacheSize is None else EmpDbCache(cacheSize)
+        # schema : layout of a new database, an existing one keeps its own, see migrate()
+        # - 1 : the Students table stores every column as TEXT
+        # - 2 : the StudentRows table stores program, gender and status as integer codes of the LOOKUPS tables,
+        #       Students is a view in front of it with the same columns, so every query and method works unchanged
+        # integerIds : schema 2 only, id is an INTEGER PRIMARY KEY, the rows are then clustered by id
+        #       without a separate id index, every id must be an integer and rows return it as an int
+        if schema not in (1, 2):
+            raise Exception(f"Unknown schema {schema}")
+        self.schema = schema
+        self.integerIds = integerIds
 
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Students (
-                id TEXT PRIMARY KEY,
-                name TEXT,
-                program TEXT,
-                gender TEXT,
-                status TEXT)''')
-        self.conn.commit()
-        self.conn.close()
+        self.create_table()
 
     def connect_cursor(self):
-        self.conn = sqlite3.connect(self.dbName)
-        self.cursor = self.conn.cursor()        
+        # opens the connection of the calling thread on first use, later calls reuse it
+        if getattr(self.local, 'conn', None) is not None:
+            return
+        # only the owning thread uses the connection, close() may run on another thread
+        conn = sqlite3.connect(self.dbName, check_same_thread=False)
+        for pragma, value in self.profile.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        self.local.conn = conn
+        self.local.cursor = conn.cursor()
+        self.local.dataVersion = None
+        self.local.cacheSynced = None
+        with self.connectionsLock:
+            self.connections.append(conn)
+
+    @property
+    def conn(self):
+        self.connect_cursor()
+        return self.local.conn
+
+    @property
+    def cursor(self):
+        self.connect_cursor()
+        return self.local.cursor
 
     def commit_close(self):
-        self.conn.commit()
-        self.conn.close()        
+        # commits the current transaction, pending group-commit mutations included, the connection stays open
+        with self.pendingLock:
+            self.conn.commit()
+            self.version += 1
+            self.committed(self.conn)
+
+    def committed(self, conn):
+        # updates commitStats after a commit of 'conn', called with pendingLock held
+        mutations, since = self.pending.pop(conn, (0, None))
+        self.commitStats['commits'] += 1
+        self.commitStats['mutations'] += mutations
+        if since is not None:
+            self.commitStats['maxLag'] = max(self.commitStats['maxLag'], time.perf_counter() - since)
+
+    def write(self, sql, params):
+        # runs one mutation and commits it, or in group-commit mode leaves it pending
+        # a failing mutation is rolled back, the connection is long-lived and would keep the write lock
+        if self.groupCommit is None:
+            try:
+                self.cursor.execute(sql, params)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.commit_close()
+            self.commitStats['mutations'] += 1
+            return
+        maxOps, maxDelay = self.groupCommit
+        with self.pendingLock:
+            conn = self.conn
+            # SQLite has a single writer : the mutations pending on another thread's connection hold
+            # the write lock until a commit, which needs pendingLock, so they are committed first
+            for other in [other for other in self.pending if other is not conn]:
+                other.commit()
+                self.committed(other)
+            if conn in self.pending:
+                # only the failing mutation is undone, the mutations pending before it stay
+                self.cursor.execute('SAVEPOINT write')
+                try:
+                    self.cursor.execute(sql, params)
+                except Exception:
+                    if conn.in_transaction:
+                        self.cursor.execute('ROLLBACK TO write')
+                        self.cursor.execute('RELEASE write')
+                    else:
+                        # SQLite rolled back the whole transaction
+                        self.pending.pop(conn)
+                    raise
+                self.cursor.execute('RELEASE write')
+            else:
+                try:
+                    self.cursor.execute(sql, params)
+                except Exception:
+                    conn.rollback()
+                    raise
+            self.version += 1
+            mutations, since = self.pending.get(conn, (0, time.perf_counter()))
+            self.pending[conn] = (mutations + 1, since)
+            if mutations + 1 >= maxOps:
+                conn.commit()
+                self.committed(conn)
+            elif self.flushTimer is None:
+                self.flushTimer = threading.Timer(maxDelay, self.flush)
+                self.flushTimer.daemon = True
+                self.flushTimer.start()
+
+    def flush(self):
+        # commits the pending group-commit mutations of every thread
+        # returns the number of mutations committed
+        with self.pendingLock:
+            if self.flushTimer is not None:
+                self.flushTimer.cancel()
+                self.flushTimer = None
+            flushed = 0
+            for conn, (mutations, since) in list(self.pending.items()):
+                conn.commit()
+                self.committed(conn)
+                flushed += mutations
+            return flushed
+
+    def close(self):
+        # commits the pending mutations and closes the connections of every thread, the next call opens new ones
+        self.flush()
+        with self.connectionsLock:
+            connections, self.connections = self.connections, []
+            self.local = threading.local()
+        for conn in connections:
+            # keeps the planner statistics of the indexes up to date
+            conn.execute('PRAGMA optimize')
+            conn.close()
+
+    def effective_settings(self):
+        # returns the PRAGMA values in effect on the calling thread's connection
+        settings = {}
+        for pragma in self.PROFILES['balanced']:
+            value = self.cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+            settings[pragma] = self.PRAGMA_VALUES.get(pragma, {}).get(value, value)
+        return settings
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sync_version(self):
+        # commits made by other connections or processes also bump the version,
+        # PRAGMA data_version changes whenever another connection commits,
+        # a connection seen for the first time bumps it too since it may have missed some
+        dataVersion = self.cursor.execute('PRAGMA data_version').fetchone()[0]
+        if self.local.dataVersion != dataVersion:
+            self.version += 1
+            if self.cache is not None:
+                self.catch_up_cache()
+        self.local.dataVersion = dataVersion
+
+    def sync_cache(self):
+        # sync_version() for the cached reads, at most once every CACHE_SYNC_INTERVAL seconds per thread
+        self.connect_cursor()
+        now = time.monotonic()
+        if self.local.cacheSynced is None or now - self.local.cacheSynced >= self.CACHE_SYNC_INTERVAL:
+            self.sync_version()
+            self.local.cacheSynced = now
+
+    def catch_up_cache(self):
+        # another connection committed, maybe a thread of this object whose writes already updated the cache
+        # the rows it changed are unknown so the LRU is emptied, but the Bloom filter only lacks the ids inserted
+        # since it was filled : a new row gets a rowid past the largest one, the mark, as long as the row at
+        # the mark is still there, otherwise the filter is built again
+        # with integerIds the rowid is the id, new rows can land anywhere and the filter is built again too
+        state = self.cache.drop_rows()
+        if state is None:
+            return
+        bloom, mark = state
+        if mark is not None and not self.integerIds:
+            row = self.cursor.execute(f'SELECT id FROM {self.rowsTable} WHERE rowid = ?', (mark[0],)).fetchone()
+            if row is not None and str(row[0]) == mark[1]:
+                rows = self.cursor.execute(f'SELECT rowid, id FROM {self.rowsTable} WHERE rowid > ? ORDER BY rowid',
+                                           (mark[0],)).fetchall()
+                self.cache.catch_up((id for rowid, id in rows), bloom, (rows[-1][0], str(rows[-1][1])) if rows else None)
+                return
+        self.cache.clear()
+
+    def changed_since(self, version):
+        # True if the database changed after 'version', a value of the 'version' attribute
+        self.sync_version()
+        return self.version != version
 
     def create_table(self):
         self.connect_cursor()
-        self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS Students (
-                    id TEXT PRIMARY KEY,
-                    name TEXT,
-                    program TEXT,
-                    gender TEXT,
-                    status TEXT)''')
+        kind = self.cursor.execute("SELECT type FROM sqlite_master WHERE name = 'Students'").fetchone()
+        if kind is not None:
+            self.schema = 2 if kind[0] == 'view' else 1
+            if self.schema == 2:
+                columns = self.cursor.execute('PRAGMA table_info(StudentRows)').fetchall()
+                self.integerIds = columns[0][2] == 'INTEGER'
+        # the table holding the rows, indexes and triggers are created on it
+        self.rowsTable = 'Students' if self.schema == 1 else 'StudentRows'
+        if self.schema == 1:
+            self.integerIds = False
+            self.cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS Students (
+                        id TEXT PRIMARY KEY,
+                        name TEXT,
+                        program TEXT,
+                        gender TEXT,
+                        status TEXT)''')
+        else:
+            self.create_view()
+        # (column, id) indexes let fetch_page() walk a column order without sorting,
+        # count_by() and count_where() are answered from the program, gender and status ones
+        for column in ('name', 'program', 'gender', 'status'):
+            self.cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_students_{column} ON {self.rowsTable} ({column}, id)')
+        # covers the dashboard counts that combine program with status and gender
+        self.cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_students_counts ON {self.rowsTable} (program, status, gender)')
+        # versions recorded by the 'newest' merge policy, a row without one loses to any incoming version
+        self.cursor.execute('CREATE TABLE IF NOT EXISTS StudentVersions (id TEXT PRIMARY KEY, version INTEGER) WITHOUT ROWID')
+        self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS students_versions_delete AFTER DELETE ON {self.rowsTable} BEGIN
+                    DELETE FROM StudentVersions WHERE id = old.id;
+                END''')
+        self.create_search_index()
         self.commit_close()
 
+    def create_rows_table(self):
+        # schema 2 : the lookup tables and the StudentRows table
+        for table in self.LOOKUPS.values():
+            self.cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} (code INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+        self.cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS StudentRows (
+                    id {'INTEGER' if self.integerIds else 'TEXT'} PRIMARY KEY,
+                    name TEXT,
+                    program INTEGER REFERENCES Programs,
+                    gender INTEGER REFERENCES Genders,
+                    status INTEGER REFERENCES Statuses)''')
+
+    def create_view(self):
+        # schema 2 : the Students view in front of StudentRows, with the INSTEAD OF triggers that make it writable
+        # a new program, gender or status value is added to its lookup table by the first row using it
+        self.create_rows_table()
+        self.cursor.execute(f'CREATE VIEW IF NOT EXISTS Students AS {self.VIEW}')
+        add = ''.join(f'INSERT OR IGNORE INTO {table} (name) SELECT new.{field} WHERE new.{field} IS NOT NULL;\n'
+                      for field, table in self.LOOKUPS.items())
+        codes = ', '.join(f'(SELECT code FROM {table} WHERE name = new.{field})' for field, table in self.LOOKUPS.items())
+        self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS students_view_insert INSTEAD OF INSERT ON Students BEGIN
+                    {add}
+                    INSERT INTO StudentRows (id, name, program, gender, status) VALUES (new.id, new.name, {codes});
+                END''')
+        self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS students_view_update INSTEAD OF UPDATE ON Students BEGIN
+                    {add}
+                    UPDATE StudentRows SET (id, name, program, gender, status) = (new.id, new.name, {codes}) WHERE id = old.id;
+                END''')
+        self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS students_view_delete INSTEAD OF DELETE ON Students BEGIN
+                    DELETE FROM StudentRows WHERE id = old.id;
+                END''')
+
+    def migrate(self, integerIds=False, vacuum=True):
+        # converts a schema 1 database to schema 2 in one transaction, a failure leaves it untouched
+        # integerIds : see __init__(), the migration fails if an id is not an integer
+        # vacuum : rebuilds the file afterwards so the space of the old table is returned
+        # other connections must not write during the migration
+        # returns {'rows': rows migrated, 'seconds': elapsed time, 'bytes': (file size before, file size after)}
+        if self.schema == 2:
+            raise Exception('The database already uses schema 2')
+        self.flush()
+        start = time.perf_counter()
+        before = self.file_size()
+        fields = ', '.join(f'{table}.code' for table in self.LOOKUPS.values())
+        joins = ' '.join(f'LEFT JOIN {table} ON {table}.name = Students.{field}' for field, table in self.LOOKUPS.items())
+        try:
+            self.cursor.execute('BEGIN IMMEDIATE')
+            self.cursor.execute('DROP TABLE IF EXISTS StudentsFts')
+            self.schema, self.integerIds = 2, integerIds
+            self.create_rows_table()
+            for field, table in self.LOOKUPS.items():
+                self.cursor.execute(f'INSERT OR IGNORE INTO {table} (name) SELECT DISTINCT {field} FROM Students WHERE {field} IS NOT NULL')
+            self.cursor.execute(f'''INSERT INTO StudentRows (id, name, program, gender, status)
+                                    SELECT Students.id, Students.name, {fields} FROM Students {joins} ORDER BY Students.id''')
+            rows = self.cursor.rowcount
+            # also drops the indexes and triggers of the old table, create_table() then adds the view and commits
+            self.cursor.execute('DROP TABLE Students')
+            self.create_table()
+        except Exception:
+            self.conn.rollback()
+            self.schema, self.integerIds, self.rowsTable = 1, False, 'Students'
+            raise
+        if vacuum:
+            self.cursor.execute('VACUUM')
+            # VACUUM may renumber the rowids the FTS5 index refers to
+            self.rebuild_search_index()
+            self.commit_close()
+        self.snapshotVersion = None
+        if self.cache is not None:
+            self.cache.clear()
+        return {'rows': rows, 'seconds': time.perf_counter() - start, 'bytes': (before, self.file_size())}
+
+    def file_size(self):
+        # returns the size of the database in bytes, free pages included
+        pageCount = self.cursor.execute('PRAGMA page_count').fetchone()[0]
+        return pageCount * self.cursor.execute('PRAGMA page_size').fetchone()[0]
+
+    def create_search_index(self):
+        # FTS5 index over the names of rowsTable, an external content table that stores only the index, not the names
+        # the triggers keep it in step with every insert, update and delete made by any connection
+        exists = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'StudentsFts'").fetchone()
+        self.cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS StudentsFts USING fts5(
+                    name,
+                    content='{self.rowsTable}',
+                    content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3')''')
+        self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON {self.rowsTable} BEGIN
+                    INSERT INTO StudentsFts (rowid, name) VALUES (new.rowid, new.name);
+                END''')
+        self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON {self.rowsTable} BEGIN
+                    INSERT INTO StudentsFts (StudentsFts, rowid, name) VALUES ('delete', old.rowid, old.name);
+                END''')
+        self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF id, name ON {self.rowsTable} BEGIN
+                    INSERT INTO StudentsFts (StudentsFts, rowid, name) VALUES ('delete', old.rowid, old.name);
+                    INSERT INTO StudentsFts (rowid, name) VALUES (new.rowid, new.name);
+                END''')
+        if not exists:
+            # a database created before the index has rows the triggers never saw
+            self.rebuild_search_index()
+
+    def rebuild_search_index(self):
+        # rebuilds the FTS5 index from rowsTable, e.g. after a VACUUM renumbered the rowids
+        self.cursor.execute("INSERT INTO StudentsFts (StudentsFts) VALUES ('rebuild')")
+
     def fetch_students(self):
+        # the snapshot is cached as an immutable tuple until the next change
+        # it is shared by every thread, so it is bypassed while mutations are pending :
+        # each thread then reads the rows its own connection sees
+        self.sync_version()
+        if self.snapshotVersion == self.version and not self.pending:
+            return self.snapshot
         self.connect_cursor()
         self.cursor.execute('SELECT * FROM Students')
-        students =self.cursor.fetchall()
-        self.conn.close()
+        students = tuple(self.cursor.fetchall())
+        if self.pending:
+            return students
+        self.snapshot = students
+        self.snapshotVersion = self.version
         return students
 
+    def iter_students(self, batch_size=1000):
+        # yields the Student rows one by one, in fetch_students() order,
+        # reading batch_size rows at a time from a cursor of its own
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('SELECT * FROM Students')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cursor.close()
+
+    def fetch_page(self, after_id=None, limit=100, order_by='id', after_value=None):
+        # returns up to 'limit' rows following the row 'after_id' in 'order_by' order, ties broken by id
+        # keyset pagination : the page starts with an index seek, so page N costs the same as page 1
+        # after_id None returns the first page, pass the id of the last row of a page to get the next one
+        # after_value : the order_by value of that row, looked up by id when not given
+        if order_by not in self.FIELDS:
+            raise Exception(f"Unknown field '{order_by}'")
+
+        if self.schema == 2 and order_by in self.LOOKUPS:
+            return self.fetch_page_codes(after_id, limit, order_by, after_value)
+        if after_id is None:
+            self.cursor.execute(f'SELECT * FROM Students ORDER BY {order_by}, id LIMIT ?', (limit,))
+        elif order_by == 'id':
+            self.cursor.execute('SELECT * FROM Students WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit))
+        else:
+            if after_value is None:
+                row = self.cursor.execute(f'SELECT {order_by} FROM Students WHERE id = ?', (after_id,)).fetchone()
+                if row is None:
+                    raise Exception(f"ID {after_id} does not exist, pass its after_value")
+                after_value = row[0]
+            if after_value is None:
+                # NULL sorts first and compares to nothing : the rest of the NULL rows, then the rows with a value
+                rows = self.cursor.execute(f'SELECT * FROM Students WHERE {order_by} IS NULL AND id > ? ORDER BY id LIMIT ?',
+                                           (after_id, limit)).fetchall()
+                if len(rows) < limit:
+                    rows += self.cursor.execute(f'SELECT * FROM Students WHERE {order_by} IS NOT NULL ORDER BY {order_by}, id LIMIT ?',
+                                                (limit - len(rows),)).fetchall()
+                return rows
+            self.cursor.execute(f'SELECT * FROM Students WHERE ({order_by}, id) > (?, ?) ORDER BY {order_by}, id LIMIT ?',
+                                (after_value, after_id, limit))
+        return self.cursor.fetchall()
+
+    def fetch_page_codes(self, after_id, limit, order_by, after_value):
+        # fetch_page() of schema 2 on a categorical column : the view sorts on the names of the lookup table,
+        # which no index covers, so the rows of each code are read in turn, in the order of the names,
+        # each with a seek in the (code, id) index of StudentRows
+        # rows without a value come first, like NULL in ORDER BY
+        if after_id is not None and after_value is None:
+            row = self.cursor.execute(f'SELECT {order_by} FROM Students WHERE id = ?', (after_id,)).fetchone()
+            if row is None:
+                raise Exception(f"ID {after_id} does not exist, pass its after_value")
+            after_value = row[0]
+        table = self.LOOKUPS[order_by]
+        first = f'{self.VIEW} WHERE StudentRows.{order_by} IS ? ORDER BY StudentRows.id LIMIT ?'
+        after = f'{self.VIEW} WHERE StudentRows.{order_by} IS ? AND StudentRows.id > ? ORDER BY StudentRows.id LIMIT ?'
+        # the codes are read lazily, a page usually needs one or two of them
+        cursor = self.conn.cursor()
+        try:
+            if after_id is None or after_value is None:
+                codes = itertools.chain([(None, None)], cursor.execute(f'SELECT name, code FROM {table} ORDER BY name'))
+            else:
+                codes = cursor.execute(f'SELECT name, code FROM {table} WHERE name >= ? ORDER BY name', (after_value,))
+            rows = []
+            for name, code in codes:
+                if after_id is not None and name == after_value:
+                    rows += self.cursor.execute(after, (code, after_id, limit - len(rows))).fetchall()
+                else:
+                    rows += self.cursor.execute(first, (code, limit - len(rows))).fetchall()
+                if len(rows) >= limit:
+                    break
+        finally:
+            cursor.close()
+        return rows
+
+    def fetch_range(self, start, limit=100):
+        # returns up to 'limit' rows starting at position 'start' of the id order, for views that jump to any row
+        # OFFSET starts from the closest position an earlier call started at, so scrolling near
+        # the previous calls skips a few rows instead of every row before 'start'
+        # the remembered positions are dropped by every change
+        self.sync_version()
+        if self.rangeVersion != self.version:
+            self.rangePositions, self.rangeIds = [], []
+            self.rangeVersion = self.version
+        anchor = bisect.bisect_right(self.rangePositions, start) - 1
+        if anchor < 0:
+            self.cursor.execute('SELECT * FROM Students ORDER BY id LIMIT ? OFFSET ?', (limit, start))
+        else:
+            self.cursor.execute('SELECT * FROM Students WHERE id >= ? ORDER BY id LIMIT ? OFFSET ?',
+                                (self.rangeIds[anchor], limit, start - self.rangePositions[anchor]))
+        rows = self.cursor.fetchall()
+        if rows and (anchor < 0 or self.rangePositions[anchor] != start):
+            if len(self.rangePositions) >= 4096:
+                self.rangePositions, self.rangeIds, anchor = [], [], -1
+            self.rangePositions.insert(anchor + 1, start)
+            self.rangeIds.insert(anchor + 1, rows[0][0])
+        return rows
+
+    def range_key(self, id):
+        # returns a value that sorts 'id' like the rows of fetch_range(), for views placing a row they did not read
+        return int(id) if self.integerIds else str(id)
+
+    def where_clause(self, filters):
+        # returns the WHERE clause and its parameters for field=value filters
+        for field in filters:
+            if field not in self.FIELDS:
+                raise Exception(f"Unknown field '{field}'")
+        if not filters:
+            return '', ()
+        # schema 2 compares the codes of rowsTable, the lookup of a value that was never stored returns NULL
+        terms = [f'{field} = (SELECT code FROM {self.LOOKUPS[field]} WHERE name = ?)' if self.schema == 2 and field in self.LOOKUPS
+                 else f'{field} = ?' for field in filters]
+        return ' WHERE ' + ' AND '.join(terms), tuple(filters.values())
+
+    def count_by(self, field, **filters):
+        # returns {value: number of rows} for 'field', counted with GROUP BY inside SQLite
+        # filters are field=value pairs restricting the counted rows, e.g. count_by('status', program='BS CoE')
+        if field not in self.FIELDS:
+            raise Exception(f"Unknown field '{field}'")
+        where, params = self.where_clause(filters)
+        if self.schema == 2 and field in self.LOOKUPS:
+            # counts the codes, then names the few groups
+            table = self.LOOKUPS[field]
+            self.cursor.execute(f'''SELECT {table}.name, counts.n
+                                    FROM (SELECT {field} AS code, COUNT(*) AS n FROM StudentRows{where} GROUP BY {field}) AS counts
+                                    LEFT JOIN {table} ON {table}.code = counts.code''', params)
+        else:
+            self.cursor.execute(f'SELECT {field}, COUNT(*) FROM {self.rowsTable}{where} GROUP BY {field}', params)
+        return dict(self.cursor.fetchall())
+
+    def count_where(self, **filters):
+        # returns the number of rows matching every field=value filter, e.g. count_where(program='BS CoE', status='Enrolled')
+        where, params = self.where_clause(filters)
+        self.cursor.execute(f'SELECT COUNT(*) FROM {self.rowsTable}{where}', params)
+        return self.cursor.fetchone()[0]
+
+    def search_students(self, query, limit=20):
+        # full-text search of the names, returns up to 'limit' rows, best bm25 match first
+        # every word of 'query' must match the start of a word of the name, in any order :
+        # 'ma sant' finds 'Maria Santos' and 'Santiago, Mark'
+        # FTS5 operators in 'query' are not interpreted, each word is quoted as a prefix term
+        terms = ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+        if not terms:
+            return []
+        if self.schema == 1:
+            join = 'JOIN Students ON Students.rowid = StudentsFts.rowid'
+        else:
+            join = 'JOIN StudentRows ON StudentRows.rowid = StudentsFts.rowid JOIN Students ON Students.id = StudentRows.id'
+        self.cursor.execute(f'''SELECT Students.* FROM StudentsFts {join}
+                                WHERE StudentsFts MATCH ? ORDER BY StudentsFts.rank, Students.id LIMIT ?''', (terms, limit))
+        return self.cursor.fetchall()
+
     def insert_student(self, id, name, program, gender, status):
-        self.connect_cursor()
-        self.cursor.execute('INSERT INTO Students (id, name, program, gender, status) VALUES (?, ?, ?, ?, ?)',
-                    (id, name, program, gender, status))
-        self.commit_close()
+        self.write('INSERT INTO Students (id, name, program, gender, status) VALUES (?, ?, ?, ?, ?)',
+                   (id, name, program, gender, status))
+        if self.cache is not None:
+            self.cache.add_id(id)
+
+    def insert_many(self, rows, batchSize=None):
+        # inserts every (id, name, program, gender, status) row of 'rows' with executemany
+        # batchSize : None inserts everything in one transaction, otherwise commits every batchSize rows
+        # a failing batch is rolled back, the batches committed before it are kept
+        # returns the number of inserted rows
+        if self.cache is not None:
+            rows = self.cache.track(rows)
+        rows = iter(rows)
+        inserted = 0
+        while True:
+            batch = rows if batchSize is None else itertools.islice(rows, batchSize)
+            # a group-commit write() waits for the batch instead of for the write lock it holds
+            with self.pendingLock:
+                if self.groupCommit is not None:
+                    # the rollback of a failing batch must not undo pending mutations
+                    self.flush()
+                try:
+                    if self.schema == 1:
+                        self.cursor.executemany('INSERT INTO Students (id, name, program, gender, status) VALUES (?, ?, ?, ?, ?)', batch)
+                        count = self.cursor.rowcount
+                    else:
+                        count = self.insert_staged(batch)
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                self.commit_close()
+            self.commitStats['mutations'] += count
+            inserted += count
+            if batchSize is None or count < batchSize:
+                return inserted
+
+    def stage(self, sql, rows):
+        # fills temp.MergeBatch with 'rows' using the INSERT statement 'sql'
+        # returns the SELECT of the staged rows in the columns of rowsTable, in schema 2 the
+        # lookup tables get the new values and the SELECT turns the values into codes
+        self.cursor.execute('''CREATE TEMP TABLE IF NOT EXISTS MergeBatch (
+                                   id TEXT PRIMARY KEY, name TEXT, program TEXT, gender TEXT, status TEXT, version INTEGER)''')
+        self.cursor.execute('DELETE FROM temp.MergeBatch')
+        self.cursor.executemany(sql, rows)
+        if self.schema == 1:
+            return 'SELECT id, name, program, gender, status FROM temp.MergeBatch WHERE true'
+        for field, table in self.LOOKUPS.items():
+            self.cursor.execute(f'INSERT OR IGNORE INTO {table} (name) SELECT DISTINCT {field} FROM temp.MergeBatch WHERE {field} IS NOT NULL')
+        codes = ', '.join(f'{table}.code' for table in self.LOOKUPS.values())
+        joins = ' '.join(f'LEFT JOIN {table} ON {table}.name = MergeBatch.{field}' for field, table in self.LOOKUPS.items())
+        return f'SELECT MergeBatch.id, MergeBatch.name, {codes} FROM temp.MergeBatch {joins} WHERE true'
+
+    def insert_staged(self, rows, chunkSize=10000):
+        # schema 2 : inserts the rows into StudentRows through temp.MergeBatch, chunkSize rows at a time,
+        # in the current transaction
+        # returns the number of inserted rows
+        rows = iter(rows)
+        inserted = 0
+        while True:
+            chunk = list(itertools.islice(rows, chunkSize))
+            if not chunk:
+                self.cursor.execute('DELETE FROM temp.MergeBatch')
+                return inserted
+            select = self.stage('INSERT INTO temp.MergeBatch (id, name, program, gender, status) VALUES (?, ?, ?, ?, ?)', chunk)
+            self.cursor.execute(f'INSERT INTO StudentRows (id, name, program, gender, status) {select}')
+            inserted += self.cursor.rowcount
 
     def delete_student(self, id):
-        self.connect_cursor()
-        self.cursor.execute('DELETE FROM Students WHERE id = ?', (id,))
-        self.commit_close()
+        self.write('DELETE FROM Students WHERE id = ?', (id,))
+        if self.cache is not None:
+            self.cache.discard(id)
 
     def update_student(self, name, program, gender, status, id):
-        self.connect_cursor()
-        self.cursor.execute('''UPDATE Students SET name=?, program=?, gender=?, status=? WHERE id=?''', (self, name, program, gender, status, id))
-        self.commit_close()
-        
+        self.write('''UPDATE Students SET name=?, program=?, gender=?, status=? WHERE id=?''', (name, program, gender, status, id))
+        if self.cache is not None:
+            self.cache.discard(id)
+
     def id_exists(self, id):
+        if self.cache is not None:
+            return self.get_student(id) is not None
         self.connect_cursor()
         self.cursor.execute('SELECT COUNT(*) FROM Students WHERE id = ?', (id,))
         result =self.cursor.fetchone()
-        self.conn.close()
         return result[0] > 0
 
-    def export_csv(self):
-        with open(self.csvFile, "w") as filehandle:
-            dbEntries = self.fetch_students()
-            for entry in dbEntries:
-                print(entry)
-                filehandle.write(f"{entry[0]},{entry[1]},{entry[2]},{entry[3]},{entry[4]}\n")
+    def get_student(self, id):
+        # returns the row of 'id', or None if there is no such row
+        # with a cache, an id missing from the Bloom filter returns None without a query
+        # and a row found in the LRU is returned without one
+        if self.cache is None:
+            return self.cursor.execute('SELECT * FROM Students WHERE id = ?', (id,)).fetchone()
+        self.sync_cache()
+        if self.cache.bloom is None:
+            self.build_bloom()
+        if not self.cache.might_contain(id):
+            return None
+        if self.pending:
+            # the LRU is shared by every thread, a row read while mutations are pending
+            # may be another connection's view of it
+            return self.cursor.execute('SELECT * FROM Students WHERE id = ?', (id,)).fetchone()
+        row = self.cache.get(id)
+        if row is None:
+            row = self.cursor.execute('SELECT * FROM Students WHERE id = ?', (id,)).fetchone()
+            if row is None:
+                self.cache.missing()
+            else:
+                self.cache.put(row)
+        return row
 
-    def export_json(self, dbName, outputFile='students.json'):
-        self.connect_cursor(dbName)
-        self.cursor.execute('SELECT * FROM Students')
-        students = self.cursor.fetchall()
-        self.conn.close()
-
-        # Convert tuples to dictionaries
-        records = [dict(student) for student in students]
-
-        # Write to JSON file
-        with open(outputFile, 'w') as f:
-            json.dump(records, f, indent=4)
-        
-    def import_csv(self, file_path):
-        with open(file_path, newline='') as csvfile:
+    def existing_ids(self, ids, chunkSize=500):
+        # returns the set of the ids of 'ids' that exist, as strings, for duplicate checks of a whole import batch
+        # ids are looked up chunkSize at a time with IN (...), with a cache only the Bloom filter matches are
+        ids = list(ids)
+        if self.cache is None:
+            candidates = [str(id) for id in ids]
+        else:
+            self.sync_cache()
+            if self.cache.bloom is None:
+                self.build_bloom()
+            candidates = self.cache.candidates(ids)
+        found = set()
+        for start in range(0, len(candidates), chunkSize):
+            chunk = candidates[start:start + chunkSize]
+            self.cursor.execute(f"SELECT id FROM {self.rowsTable} WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            found.update(str(row[0]) for row in self.cursor.fetchall())
+        if self.cache is not None:
+            self.cache.missing(len(set(candidates)) - len(found))
+        return found
+
+    def build_bloom(self):
+        # fills the Bloom filter of the cache from the ids of the table, read from the primary key index
+        token = self.cache.start_build()
+        count = self.cursor.execute(f'SELECT COUNT(*) FROM {self.rowsTable}').fetchone()[0]
+        # read before the ids, a row inserted in between is added again by the next catch_up_cache()
+        mark = self.cursor.execute(f'SELECT rowid, id FROM {self.rowsTable} ORDER BY rowid DESC LIMIT 1').fetchone()
+        cursor = self.conn.cursor()
+        try:
+            self.cache.build((row[0] for row in cursor.execute(f'SELECT id FROM {self.rowsTable}')), count, token,
+                             None if mark is None else (mark[0], str(mark[1])))
+        finally:
+            cursor.close()
+
+    def export_csv(self, outputFile=None, compression=None):
+        # streams the rows to a CSV file with a header row, iter_students() holds one batch in memory at a time
+        # outputFile : defaults to the database name with a .csv extension, '.gz' or '.xz' added when compressed
+        # compression : None, 'gzip' or 'lzma'
+        # returns False without writing if nothing changed since the last export to outputFile
+        if outputFile is None:
+            outputFile = self.csvFile + EmpDbExport.EXTENSIONS[compression]
+        if not self.export_needed(outputFile, compression):
+            return False
+        version = self.version
+        EmpDbExport.write_csv(outputFile, self.iter_students(), compression)
+        self.exportVersions[(outputFile, compression)] = version
+        return True
+
+    def export_json(self, outputFile='students.json', compression=None):
+        # streams the rows to a JSON array of objects, written incrementally one object per line
+        # compression : None, 'gzip' or 'lzma'
+        # returns False without writing if nothing changed since the last export to outputFile
+        if not self.export_needed(outputFile, compression):
+            return False
+        version = self.version
+        EmpDbExport.write_json(outputFile, self.iter_students(), compression)
+        self.exportVersions[(outputFile, compression)] = version
+        return True
+
+    def export_needed(self, outputFile, compression):
+        # False if outputFile still holds an export of the current version
+        self.sync_version()
+        return self.exportVersions.get((outputFile, compression)) != self.version or not os.path.exists(outputFile)
+
+    def backup(self, target_path, pages_per_step=None, progress=None, sleep=0.005):
+        # copies the live database to 'target_path' with the SQLite online backup API
+        # the copy runs in steps of pages_per_step pages, -1 copies everything in one step
+        # - other connections can write between the steps, a write restarts the copy so it stays consistent
+        # - in WAL mode a step only holds a read lock and never blocks writers, so the default None copies
+        #   in one step there, a steady stream of writes would keep restarting a stepped copy;
+        #   with a rollback journal the default is 1024 pages per step
+        # progress(status, remaining, total) is called after every step, sleep is the pause between steps in seconds
+        # the copy is written next to target_path and renamed over it once complete
+        # returns {'pages': pages copied, 'seconds': elapsed time}
+        self.flush()
+        if pages_per_step is None:
+            walMode = self.cursor.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            pages_per_step = -1 if walMode else 1024
+        start = time.perf_counter()
+        tmpPath = target_path + '.tmp'
+        target = sqlite3.connect(tmpPath)
+        try:
+            self.conn.backup(target, pages=pages_per_step, progress=progress, sleep=sleep)
+            pages = target.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            target.close()
+        os.replace(tmpPath, target_path)
+        return {'pages': pages, 'seconds': time.perf_counter() - start}
+
+    def snapshot_to_memory(self):
+        # returns a read-only in-memory copy of the database as an sqlite3 connection, for heavy reporting queries
+        # the copy does not follow later changes and can be used from any thread, the caller closes it
+        self.flush()
+        memory = sqlite3.connect(':memory:', check_same_thread=False)
+        self.conn.backup(memory)
+        memory.execute('PRAGMA query_only = ON')
+        return memory
+
+    def merge_many(self, rows, policy='skip'):
+        # merges (id, name, program, gender, status, version) rows into rowsTable in one transaction
+        # with INSERT ... ON CONFLICT, policy is one of MERGE_POLICIES
+        # version is an integer that grows with every change of a row, e.g. a timestamp,
+        # it is only used and recorded by 'newest' and may be None for the other policies
+        # an id repeated in 'rows' is merged once : the first row for 'skip', the last one for 'overwrite',
+        # the highest version for 'newest', the other rows count as skipped
+        # an update that would not change the stored row counts as skipped
+        # returns {'inserted': rows inserted, 'updated': rows replaced, 'skipped': rows left out}
+        if policy not in self.MERGE_POLICIES:
+            raise Exception(f"Unknown merge policy '{policy}'")
+        rows = list(rows if self.cache is None else self.cache.track(rows))
+        staging = {
+            'skip': 'INSERT OR IGNORE INTO temp.MergeBatch VALUES (?, ?, ?, ?, ?, ?)',
+            'overwrite': 'INSERT OR REPLACE INTO temp.MergeBatch VALUES (?, ?, ?, ?, ?, ?)',
+            'newest': '''INSERT INTO temp.MergeBatch VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE
+                         SET name = excluded.name, program = excluded.program, gender = excluded.gender,
+                             status = excluded.status, version = excluded.version
+                         WHERE excluded.version > MergeBatch.version''',
+        }[policy]
+        upsert = {
+            'skip': 'NOTHING',
+            'overwrite': '''UPDATE SET name = excluded.name, program = excluded.program, gender = excluded.gender, status = excluded.status
+                            WHERE (name, program, gender, status) IS NOT (excluded.name, excluded.program, excluded.gender, excluded.status)''',
+            'newest': '''UPDATE SET name = excluded.name, program = excluded.program, gender = excluded.gender, status = excluded.status
+                         WHERE NOT EXISTS (SELECT 1 FROM StudentVersions
+                                           WHERE StudentVersions.id = excluded.id
+                                           AND StudentVersions.version >= (SELECT version FROM temp.MergeBatch WHERE MergeBatch.id = excluded.id))''',
+        }[policy]
+        # a group-commit write() waits for the merge instead of for the write lock it holds
+        with self.pendingLock:
+            if self.groupCommit is not None:
+                # the rollback of a failing merge must not undo pending mutations
+                self.flush()
+            try:
+                select = self.stage(staging, rows)
+                merged = self.cursor.execute('SELECT COUNT(*) FROM temp.MergeBatch').fetchone()[0]
+                existing = self.cursor.execute(f'SELECT COUNT(*) FROM temp.MergeBatch JOIN {self.rowsTable} USING (id)').fetchone()[0]
+                self.cursor.execute(f'''INSERT INTO {self.rowsTable} (id, name, program, gender, status) {select}
+                                        ON CONFLICT (id) DO {upsert}''')
+                changed = self.cursor.rowcount
+                if policy == 'newest':
+                    self.cursor.execute('''INSERT INTO StudentVersions (id, version) SELECT id, version FROM temp.MergeBatch WHERE true
+                                           ON CONFLICT (id) DO UPDATE SET version = excluded.version
+                                           WHERE excluded.version > StudentVersions.version OR StudentVersions.version IS NULL''')
+                self.cursor.execute('DELETE FROM temp.MergeBatch')
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.commit_close()
+        self.commitStats['mutations'] += changed
+        inserted = merged - existing
+        return {'inserted': inserted, 'updated': changed - inserted, 'skipped': len(rows) - changed}
+
+    def import_csv(self, file_path, batchSize=10000, progress=None, policy=None, versionField='version'):
+        # streams the CSV rows into the database, one transaction per batch of batchSize rows
+        # policy : None inserts with insert_many() and fails on an existing id,
+        #          or a MERGE_POLICIES name to merge the rows with merge_many()
+        # versionField : header of the CSV column holding the row versions, required by the 'newest' policy
+        # progress(rowsImported, bytesRead, totalBytes) is called after every committed batch
+        # returns {'rows': rows read, 'inserted', 'updated', 'skipped': row counts,
+        #          'seconds': elapsed time, 'rowsPerSec': throughput}
+        if policy is not None and policy not in self.MERGE_POLICIES:
+            raise Exception(f"Unknown merge policy '{policy}'")
+        totalBytes = os.path.getsize(file_path)
+        start = time.perf_counter()
+        counts = {'rows': 0, 'inserted': 0, 'updated': 0, 'skipped': 0}
+        with open(file_path, newline='', encoding='utf-8') as csvfile:
             reader = csv.reader(csvfile)
-            next(reader)  # skip the header row
-            for row in reader:
-                self.insert_student(row[0], row[1], row[2], row[3], row[4])
+            header = next(reader, None) or ()
+            if policy == 'newest':
+                if versionField not in header:
+                    raise Exception(f"No '{versionField}' column in {file_path}")
+                version = header.index(versionField)
+            while True:
+                if policy is None:
+                    batch = [(row[0], row[1], row[2], row[3], row[4]) for row in itertools.islice(reader, batchSize)]
+                elif policy == 'newest':
+                    batch = [(row[0], row[1], row[2], row[3], row[4], int(row[version])) for row in itertools.islice(reader, batchSize)]
+                else:
+                    batch = [(row[0], row[1], row[2], row[3], row[4], None) for row in itertools.islice(reader, batchSize)]
+                if not batch:
+                    break
+                counts['rows'] += len(batch)
+                if policy is None:
+                    counts['inserted'] += self.insert_many(batch)
+                else:
+                    for key, count in self.merge_many(batch, policy).items():
+                        counts[key] += count
+                if progress is not None:
+                    # the buffer position runs ahead of the parser by at most one read block
+                    progress(counts['rows'], min(csvfile.buffer.tell(), totalBytes), totalBytes)
+        seconds = time.perf_counter() - start
+        counts.update(seconds=seconds, rowsPerSec=counts['rows'] / seconds if seconds else 0.0)
+        return counts
 
-def test_EmpDb():
-    iEmpDb = EmpDbSqlite(dbName='EmpDbSql.db')
+def test_EmpDb(tmp_path):
+    iEmpDb = EmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db'))
 
     for entry in range(30):
         iEmpDb.insert_student(str(entry), f'Name{entry} Surname{entry}', f'BS CoE {entry}', 'Male', 'Enrolled')
@@ -109,6 +921,9 @@ def test_EmpDb():
 
     all_entries = iEmpDb.fetch_students()
     assert len(all_entries) == 30
+    version = iEmpDb.version
+    assert iEmpDb.fetch_students() is all_entries
+    assert not iEmpDb.changed_since(version)
 
     for entry in range(10, 20):
         iEmpDb.update_student(f'Name{entry} Surname{entry}', f'BS CoE {entry}', 'Female', 'Not Enrolled', str(entry))
@@ -117,9 +932,589 @@ def test_EmpDb():
     all_entries = iEmpDb.fetch_students()
     assert len(all_entries) == 30
 
+    assert iEmpDb.changed_since(version)
+    assert iEmpDb.fetch_students()[15] == ('15', 'Name15 Surname15', 'BS CoE 15', 'Female', 'Not Enrolled')
+
     for entry in range(10):
         iEmpDb.delete_student(entry)
         assert not iEmpDb.id_exists(entry)
 
     all_entries = iEmpDb.fetch_students()
-    assert len(all_entries) == 20
\ No newline at end of file
+    assert len(all_entries) == 20
+def test_EmpDb_connections(tmp_path):
+    dbName = str(tmp_path / 'EmpDbSql.db')
+    with EmpDbSqlite(dbName=dbName) as iEmpDb:
+        iEmpDb.insert_student('1', 'Name1', 'BS CoE', 'Male', 'Enrolled')
+        conn = iEmpDb.conn
+        assert iEmpDb.id_exists('1') and iEmpDb.conn is conn
+
+        # every thread gets its own connection
+        worker = threading.Thread(target=iEmpDb.insert_student, args=('2', 'Name2', 'BS EE', 'Female', 'Enrolled'))
+        worker.start()
+        worker.join()
+        assert len(iEmpDb.connections) == 2
+        assert len(iEmpDb.fetch_students()) == 2
+
+        # commits by another process or connection invalidate the snapshot
+        version = iEmpDb.version
+        other = sqlite3.connect(dbName)
+        other.execute("INSERT INTO Students VALUES ('3', 'Name3', 'BS ECE', 'Male', 'Enrolled')")
+        other.commit()
+        other.close()
+        assert iEmpDb.changed_since(version)
+        assert len(iEmpDb.fetch_students()) == 3
+
+        # a failing mutation is rolled back, the long-lived connection does not keep the write lock
+        for write in (lambda: iEmpDb.insert_student('1', 'Dup', 'BS CoE', 'Male', 'Enrolled'),
+                      lambda: iEmpDb.update_student('Dup', 'BS CoE', 'Male', 'Enrolled', [1])):
+            try:
+                write()
+            except (sqlite3.IntegrityError, sqlite3.ProgrammingError):
+                pass
+            else:
+                raise AssertionError('failing mutation accepted')
+            assert not iEmpDb.conn.in_transaction
+            other = sqlite3.connect(dbName, timeout=0.1)
+            other.execute("UPDATE Students SET name = 'Other' WHERE id = '3'")
+            other.commit()
+            other.close()
+
+    assert iEmpDb.connections == []
+
+def test_EmpDb_import(tmp_path):
+    filePath = str(tmp_path / 'import.csv')
+    with open(filePath, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(('id', 'name', 'program', 'gender', 'status'))
+        for entry in range(250):
+            writer.writerow((str(entry), f'Name{entry}, Jr.', 'BS CoE', 'Male', 'Enrolled'))
+
+    with EmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db')) as iEmpDb:
+        calls = []
+        stats = iEmpDb.import_csv(filePath, batchSize=100, progress=lambda *args: calls.append(args))
+        assert stats['rows'] == 250 and stats['rowsPerSec'] > 0
+        assert [call[0] for call in calls] == [100, 200, 250]
+        assert calls[-1][1] == calls[-1][2]
+        assert iEmpDb.fetch_students()[7] == ('7', 'Name7, Jr.', 'BS CoE', 'Male', 'Enrolled')
+
+        rows = [(str(entry), f'Name{entry}', 'BS EE', 'Female', 'Enrolled') for entry in range(300, 330)]
+        assert iEmpDb.insert_many(rows, batchSize=10) == 30
+
+        # the failing batch is rolled back, earlier batches stay
+        rows = [(str(entry), f'Name{entry}', 'BS EE', 'Female', 'Enrolled') for entry in range(400, 415)] + [('7', 'Dup', 'BS EE', 'Male', 'Enrolled')]
+        try:
+            iEmpDb.insert_many(rows, batchSize=10)
+        except sqlite3.IntegrityError:
+            pass
+        else:
+            raise AssertionError('duplicate id accepted')
+        assert iEmpDb.id_exists('409') and not iEmpDb.id_exists('410')
+        assert len(iEmpDb.fetch_students()) == 290
+
+def test_EmpDb_profiles(tmp_path):
+    with EmpDbSqlite(dbName=str(tmp_path / 'durable.db'), profile='durable') as iEmpDb:
+        assert iEmpDb.effective_settings() == {'journal_mode': 'wal', 'synchronous': 'FULL', 'cache_size': -16000,
+                                               'mmap_size': 0, 'temp_store': 'DEFAULT', 'busy_timeout': 5000}
+
+    with EmpDbSqlite(dbName=str(tmp_path / 'custom.db'), profile={'synchronous': 'OFF', 'cache_size': 500}) as iEmpDb:
+        settings = iEmpDb.effective_settings()
+        assert settings['synchronous'] == 'OFF' and settings['cache_size'] == 500
+        assert settings['journal_mode'] == 'delete'
+
+    for profile in ('fastest', {'synchronous': 'OFF; DROP TABLE Students'}):
+        try:
+            EmpDbSqlite(dbName=str(tmp_path / 'bad.db'), profile=profile)
+        except Exception as e:
+            assert 'profile' in str(e) or 'PRAGMA' in str(e)
+        else:
+            raise AssertionError(f'profile {profile} accepted')
+
+def test_EmpDb_pages(tmp_path):
+    with EmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db')) as iEmpDb:
+        iEmpDb.insert_many((f'{entry:03}', f'Name{entry % 7}', 'BS CoE', 'Male', 'Enrolled') for entry in range(100))
+
+        assert list(iEmpDb.iter_students(batch_size=7)) == list(iEmpDb.fetch_students())
+
+        for order_by in ('id', 'name'):
+            rows, page = [], iEmpDb.fetch_page(limit=15, order_by=order_by)
+            while page:
+                rows.extend(page)
+                page = iEmpDb.fetch_page(after_id=page[-1][0], limit=15, order_by=order_by)
+            column = iEmpDb.FIELDS.index(order_by)
+            assert rows == sorted(iEmpDb.fetch_students(), key=lambda row: (row[column], row[0]))
+
+        page = iEmpDb.fetch_page(after_id='003', limit=2, order_by='name')
+        assert [row[0] for row in page] == ['010', '017']
+        iEmpDb.delete_student('003')
+        assert iEmpDb.fetch_page(after_id='003', limit=2, order_by='name', after_value='Name3') == page
+
+        rows = sorted(iEmpDb.fetch_students())
+        for start in (40, 0, 45, 95, 120, 43):
+            assert iEmpDb.fetch_range(start, 10) == rows[start:start + 10]
+        assert iEmpDb.rangePositions == [0, 40, 43, 45, 95]
+        iEmpDb.delete_student('041')
+        assert iEmpDb.fetch_range(43, 2) == rows[44:46] and iEmpDb.rangePositions == [43]
+        assert sorted(row[0] for row in rows[:50]) == sorted((row[0] for row in rows[:50]), key=iEmpDb.range_key)
+
+        plan = iEmpDb.cursor.execute('EXPLAIN QUERY PLAN SELECT * FROM Students WHERE (name, id) > (?, ?) ORDER BY name, id LIMIT 10',
+                                     ('Name3', '003')).fetchall()
+        assert 'idx_students_name' in str(plan) and 'TEMP B-TREE' not in str(plan)
+
+        # rows without a status come first, paging goes on past them
+        iEmpDb.merge_many([(f'{entry:03}', 'Name', 'BS CoE', 'Male', None, 1) for entry in (5, 50, 51)], policy='overwrite')
+        rows, page = [], iEmpDb.fetch_page(limit=2, order_by='status')
+        while page:
+            rows.extend(page)
+            page = iEmpDb.fetch_page(after_id=page[-1][0], limit=2, order_by='status')
+        assert [row[0] for row in rows[:3]] == ['005', '050', '051'] and sorted(rows) == sorted(iEmpDb.fetch_students())
+        for statement, parameters in (('SELECT * FROM Students WHERE status IS NULL AND id > ? ORDER BY id LIMIT 2', ('005',)),
+                                      ('SELECT * FROM Students WHERE status IS NOT NULL ORDER BY status, id LIMIT 2', ())):
+            plan = iEmpDb.cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            assert 'idx_students_status' in str(plan) and 'TEMP B-TREE' not in str(plan)
+
+def test_EmpDb_counts(tmp_path):
+    with EmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db')) as iEmpDb:
+        programs = ('BS CoE', 'BS ECE', 'BS EE')
+        iEmpDb.insert_many((str(entry), f'Name{entry}', programs[entry % 3], ('Male', 'Female')[entry % 2],
+                            'Enrolled' if entry % 5 else 'Not Enrolled') for entry in range(300))
+
+        assert iEmpDb.count_by('program') == {'BS CoE': 100, 'BS ECE': 100, 'BS EE': 100}
+        assert iEmpDb.count_by('status', gender='Male') == {'Enrolled': 120, 'Not Enrolled': 30}
+        assert iEmpDb.count_where() == 300
+        assert iEmpDb.count_where(program='BS EE', status='Not Enrolled') == 20
+        iEmpDb.delete_student('5')
+        assert iEmpDb.count_where(program='BS EE', status='Not Enrolled') == 19
+
+        plan = iEmpDb.cursor.execute('EXPLAIN QUERY PLAN SELECT status, COUNT(*) FROM Students GROUP BY status').fetchall()
+        assert 'COVERING INDEX idx_students_status' in str(plan)
+
+        try:
+            iEmpDb.count_by('program; DROP TABLE Students')
+        except Exception as e:
+            assert 'Unknown field' in str(e)
+        else:
+            raise AssertionError('invalid field accepted')
+
+    # creating the indexes again is a no-op
+    with EmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db')) as iEmpDb:
+        iEmpDb.create_table()
+        assert iEmpDb.count_where() == 299
+
+def test_EmpDb_search(tmp_path):
+    dbName = str(tmp_path / 'EmpDbSql.db')
+    with EmpDbSqlite(dbName=dbName) as iEmpDb:
+        iEmpDb.insert_student('1', 'Maria Santos', 'BS CoE', 'Female', 'Enrolled')
+        iEmpDb.insert_student('2', 'Santiago, Mark', 'BS EE', 'Male', 'Enrolled')
+        iEmpDb.insert_many([('3', 'José Marañón', 'BS ECE', 'Male', 'Enrolled'),
+                            ('4', 'Mark Mark Reyes', 'BS CoE', 'Male', 'Enrolled')])
+
+        assert [row[0] for row in iEmpDb.search_students('ma sant')] == ['1', '2']
+        assert [row[0] for row in iEmpDb.search_students('jose maranon')] == ['3']
+        # more occurrences of the term rank first
+        assert [row[0] for row in iEmpDb.search_students('mark')] == ['4', '2']
+        assert iEmpDb.search_students('mar', limit=1) == [iEmpDb.search_students('mar')[0]]
+        assert iEmpDb.search_students('"NEAR(') == [] and iEmpDb.search_students('') == []
+
+        iEmpDb.update_student('Maria Cruz', 'BS CoE', 'Female', 'Enrolled', '1')
+        iEmpDb.delete_student('2')
+        assert iEmpDb.search_students('sant') == []
+        assert iEmpDb.search_students('cruz') == [('1', 'Maria Cruz', 'BS CoE', 'Female', 'Enrolled')]
+
+        # writes by another connection go through the triggers too
+        other = sqlite3.connect(dbName)
+        other.execute("INSERT INTO Students VALUES ('5', 'Ana Cruz', 'BS EE', 'Female', 'Enrolled')")
+        other.execute("UPDATE Students SET id = '6' WHERE id = '4'")
+        other.commit()
+        other.close()
+        assert [row[0] for row in iEmpDb.search_students('cruz')] == ['1', '5']
+        assert iEmpDb.search_students('reyes')[0][0] == '6'
+
+        # the index holds exactly the names of the table
+        iEmpDb.cursor.execute("INSERT INTO StudentsFts (StudentsFts, rank) VALUES ('integrity-check', 1)")
+        for row in iEmpDb.fetch_students():
+            assert row in iEmpDb.search_students(row[1])
+
+    # a database created without the index gets it filled on open
+    dbName = str(tmp_path / 'old.db')
+    other = sqlite3.connect(dbName)
+    other.execute('CREATE TABLE Students (id TEXT PRIMARY KEY, name TEXT, program TEXT, gender TEXT, status TEXT)')
+    other.execute("INSERT INTO Students VALUES ('1', 'Maria Santos', 'BS CoE', 'Female', 'Enrolled')")
+    other.commit()
+    other.close()
+    with EmpDbSqlite(dbName=dbName) as iEmpDb:
+        assert [row[0] for row in iEmpDb.search_students('santos')] == ['1']
+
+def test_EmpDb_group_commit(tmp_path):
+    dbName = str(tmp_path / 'EmpDbSql.db')
+
+    def committed():
+        other = sqlite3.connect(dbName)
+        count = other.execute('SELECT COUNT(*) FROM Students').fetchone()[0]
+        other.close()
+        return count
+
+    with EmpDbSqlite(dbName=dbName, groupCommit=(5, 60)) as iEmpDb:
+        for entry in range(3):
+            iEmpDb.insert_student(str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled')
+        # the writer reads its pending mutations, other connections do not see them yet
+        assert committed() == 0
+        assert iEmpDb.id_exists('2') and len(iEmpDb.fetch_students()) == 3
+        iEmpDb.update_student('Renamed', 'BS EE', 'Female', 'Enrolled', '0')
+        assert iEmpDb.fetch_students()[0][1] == 'Renamed' and iEmpDb.search_students('renamed')
+
+        # a failing mutation leaves the pending ones alone
+        try:
+            iEmpDb.insert_student('1', 'Dup', 'BS CoE', 'Male', 'Enrolled')
+        except sqlite3.IntegrityError:
+            pass
+        else:
+            raise AssertionError('duplicate id accepted')
+        # the fifth mutation commits the group
+        iEmpDb.delete_student('1')
+        assert committed() == 2
+        assert iEmpDb.commitStats['mutations'] == 5
+
+        # with nothing pending a failing mutation does not keep the write lock
+        try:
+            iEmpDb.insert_student('0', 'Dup', 'BS CoE', 'Male', 'Enrolled')
+        except sqlite3.IntegrityError:
+            pass
+        else:
+            raise AssertionError('duplicate id accepted')
+        assert not iEmpDb.conn.in_transaction and not iEmpDb.pending
+        other = sqlite3.connect(dbName, timeout=0.1)
+        other.execute("INSERT INTO Students VALUES ('other', 'Other', 'BS CoE', 'Male', 'Enrolled')")
+        other.execute("DELETE FROM Students WHERE id = 'other'")
+        other.commit()
+        other.close()
+
+        iEmpDb.insert_student('9', 'Name9', 'BS CoE', 'Male', 'Enrolled')
+        assert iEmpDb.flush() == 1 and committed() == 3
+        assert iEmpDb.flush() == 0
+        iEmpDb.insert_student('10', 'Name10', 'BS CoE', 'Male', 'Enrolled')
+    # close() commits what is pending
+    assert committed() == 4
+
+    # another thread reading while mutations are pending does not hand its committed view to the writer
+    import concurrent.futures
+    with EmpDbSqlite(dbName=dbName, groupCommit=(100, 60), cacheSize=100) as iEmpDb, \
+            concurrent.futures.ThreadPoolExecutor(1) as other:
+        def read():
+            return dict((row[0], row) for row in iEmpDb.fetch_students())['0'][1], iEmpDb.get_student('0')[1]
+        # both threads have their connection open and the shared snapshot and LRU are filled
+        assert read() == other.submit(read).result() == ('Renamed', 'Renamed')
+        iEmpDb.update_student('Pending', 'BS EE', 'Female', 'Enrolled', '0')
+        assert other.submit(read).result() == ('Renamed', 'Renamed')
+        assert read() == ('Pending', 'Pending')
+        iEmpDb.flush()
+        assert other.submit(read).result() == read() == ('Pending', 'Pending')
+        assert iEmpDb.get_student('0')[1] == 'Pending' and iEmpDb.fetch_students() is iEmpDb.fetch_students()
+
+    # the delay commits a group that never fills up
+    with EmpDbSqlite(dbName=dbName, groupCommit=(1000, 0.02)) as iEmpDb:
+        iEmpDb.insert_student('11', 'Name11', 'BS CoE', 'Male', 'Enrolled')
+        deadline = time.perf_counter() + 5
+        while committed() < 5 and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        # the timer commits before it records the stats, flush() waits for it to finish
+        assert iEmpDb.flush() == 0
+        assert committed() == 5 and iEmpDb.commitStats['maxLag'] >= 0.02
+
+    # writer threads hand the write lock over instead of waiting out busy_timeout, bulk inserts included
+    with EmpDbSqlite(dbName=dbName, groupCommit=(50, 0.02)) as iEmpDb, \
+            concurrent.futures.ThreadPoolExecutor(3) as writers:
+        def write(prefix):
+            for entry in range(200):
+                iEmpDb.insert_student(f'{prefix}{entry}', 'Writer', 'BS CoE', 'Male', 'Enrolled')
+                if entry % 50 == 0:
+                    iEmpDb.update_student('Updated', 'BS EE', 'Male', 'Enrolled', f'{prefix}{entry}')
+        start = time.perf_counter()
+        futures = [writers.submit(write, prefix) for prefix in ('a', 'b')]
+        futures.append(writers.submit(iEmpDb.insert_many, ((f'c{entry}', 'Bulk', 'BS CoE', 'Male', 'Enrolled')
+                                                           for entry in range(1000)), 100))
+        for future in futures:
+            future.result()
+        assert time.perf_counter() - start < 2
+        assert iEmpDb.count_where() == 5 + 1400 and iEmpDb.count_where(name='Updated') == 8
+
+def test_EmpDb_export(tmp_path):
+    import gzip
+    import json
+
+    with EmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db')) as iEmpDb:
+        iEmpDb.insert_many((str(entry), f'Name{entry}, "Jr."\nLine2', 'BS CoE', 'Male', 'Enrolled') for entry in range(2500))
+        rows = list(iEmpDb.fetch_students())
+
+        assert iEmpDb.export_csv() and os.path.exists(str(tmp_path / 'EmpDbSql.csv'))
+        for compression, extension in ((None, ''), ('gzip', '.gz')):
+            outputFile = str(tmp_path / f'out.csv{extension}')
+            assert iEmpDb.export_csv(outputFile, compression)
+            opener = gzip.open if compression else open
+            with opener(outputFile, 'rt', newline='', encoding='utf-8') as csvfile:
+                reader = csv.reader(csvfile)
+                assert next(reader) == list(iEmpDb.FIELDS)
+                assert [tuple(row) for row in reader] == rows
+
+        outputFile = str(tmp_path / 'out.json')
+        assert iEmpDb.export_json(outputFile)
+        with open(outputFile, encoding='utf-8') as jsonfile:
+            assert [tuple(record.values()) for record in json.load(jsonfile)] == rows
+
+        # unchanged data is not exported again, a change or a missing file triggers a new export
+        assert not iEmpDb.export_json(outputFile) and not iEmpDb.export_csv()
+        iEmpDb.delete_student('0')
+        assert iEmpDb.export_json(outputFile)
+        os.remove(outputFile)
+        assert iEmpDb.export_json(outputFile)
+        with open(outputFile, encoding='utf-8') as jsonfile:
+            assert len(json.load(jsonfile)) == 2499
+
+def test_EmpDb_backup(tmp_path):
+    dbName = str(tmp_path / 'EmpDbSql.db')
+    with EmpDbSqlite(dbName=dbName, groupCommit=(1000, 60)) as iEmpDb:
+        iEmpDb.insert_many((str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled') for entry in range(3000))
+        # a pending group-commit mutation is part of the backup
+        iEmpDb.delete_student('0')
+
+        # another connection writes while the backup runs, without waiting for it to finish
+        steps = []
+        def progress(status, remaining, total):
+            if not steps:
+                other = sqlite3.connect(dbName, timeout=0)
+                other.execute("INSERT INTO Students VALUES ('new', 'Ana Cruz', 'BS EE', 'Female', 'Enrolled')")
+                other.commit()
+                other.close()
+            steps.append(remaining)
+
+        backupName = str(tmp_path / 'backup.db')
+        stats = iEmpDb.backup(backupName, pages_per_step=5, progress=progress, sleep=0)
+        assert len(steps) > 1 and steps[-1] == 0 and stats['pages'] > 5
+        assert not os.path.exists(backupName + '.tmp')
+        with EmpDbSqlite(dbName=backupName) as copy:
+            assert copy.fetch_students() == iEmpDb.fetch_students()
+            assert copy.cursor.execute('PRAGMA integrity_check').fetchone() == ('ok',)
+            assert [row[0] for row in copy.search_students('cruz')] == ['new']
+
+        memory = iEmpDb.snapshot_to_memory()
+        iEmpDb.delete_student('1')
+        assert memory.execute('SELECT COUNT(*) FROM Students').fetchone()[0] == 3000
+        assert iEmpDb.count_where() == 2999
+        try:
+            memory.execute("DELETE FROM Students")
+        except sqlite3.OperationalError:
+            pass
+        else:
+            raise AssertionError('snapshot is writable')
+        memory.close()
+
+def test_EmpDb_cache(tmp_path):
+    dbName = str(tmp_path / 'EmpDbSql.db')
+    with EmpDbSqlite(dbName=dbName, cacheSize=10) as iEmpDb:
+        iEmpDb.insert_many((str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled') for entry in range(100))
+
+        # missing ids are mostly answered by the Bloom filter
+        assert not any(iEmpDb.id_exists(str(entry)) for entry in range(1000, 3000))
+        stats = iEmpDb.cache.stats
+        assert stats['bloomNegatives'] + stats['falsePositives'] == 2000 and stats['falsePositives'] < 100
+
+        assert iEmpDb.id_exists(5) and iEmpDb.get_student('5') == ('5', 'Name5', 'BS CoE', 'Male', 'Enrolled')
+        assert stats['hits'] == 1
+        iEmpDb.update_student('Renamed', 'BS EE', 'Female', 'Enrolled', '5')
+        assert iEmpDb.get_student('5')[1] == 'Renamed'
+        iEmpDb.delete_student('5')
+        assert not iEmpDb.id_exists('5') and iEmpDb.get_student('5') is None
+
+        iEmpDb.insert_student('new', 'Ana Cruz', 'BS EE', 'Female', 'Enrolled')
+        assert iEmpDb.id_exists('new')
+        for entry in range(50):
+            iEmpDb.get_student(str(entry))
+        assert len(iEmpDb.cache.rows) == 10
+
+        # a commit by another connection empties the LRU and adds the ids it inserted to the Bloom filter,
+        # seen by the next check CACHE_SYNC_INTERVAL after the last one
+        bloom = iEmpDb.cache.bloom
+        other = sqlite3.connect(dbName)
+        other.execute("INSERT INTO Students VALUES ('999', 'Name999', 'BS EE', 'Male', 'Enrolled')")
+        other.execute("DELETE FROM Students WHERE id = '49'")
+        other.commit()
+        time.sleep(iEmpDb.CACHE_SYNC_INTERVAL)
+        assert iEmpDb.id_exists('999') and not iEmpDb.id_exists('49')
+        assert iEmpDb.cache.bloom is bloom and iEmpDb.cache.mark[1] == '999'
+
+        # so do the commits of another thread of the same object, without building the filter again
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            executor.submit(iEmpDb.insert_student, 'thread', 'Thread', 'BS EE', 'Male', 'Enrolled').result()
+        time.sleep(iEmpDb.CACHE_SYNC_INTERVAL)
+        assert iEmpDb.id_exists('thread') and iEmpDb.cache.bloom is bloom and iEmpDb.cache.mark[1] == 'thread'
+
+        # a new row may take the rowid of a deleted last row, the filter is then built again
+        other.execute("DELETE FROM Students WHERE id = 'thread'")
+        other.execute("INSERT INTO Students VALUES ('reused', 'Reused', 'BS EE', 'Male', 'Enrolled')")
+        other.commit()
+        other.close()
+        time.sleep(iEmpDb.CACHE_SYNC_INTERVAL)
+        assert iEmpDb.id_exists('reused') and not iEmpDb.id_exists('thread') and iEmpDb.cache.bloom is not bloom
+
+        # the filter is rebuilt bigger once it holds twice the rows it was built for
+        iEmpDb.insert_many((f'bulk{entry}', 'Bulk', 'BS CoE', 'Male', 'Enrolled') for entry in range(5000))
+        assert iEmpDb.id_exists('bulk4999') and not iEmpDb.id_exists('bulk5000')
+        assert iEmpDb.cache.bloom.capacity >= 10000
+
+        ids = ['bulk7', 'nope', 'new', '5', 999]
+        assert iEmpDb.existing_ids(ids) == {'bulk7', 'new', '999'}
+    with EmpDbSqlite(dbName=dbName) as iEmpDb:
+        assert iEmpDb.existing_ids(ids) == {'bulk7', 'new', '999'}
+
+def test_EmpDb_merge(tmp_path):
+    def feed(name, rows):
+        filePath = str(tmp_path / name)
+        with open(filePath, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(('id', 'name', 'program', 'gender', 'status', 'version'))
+            writer.writerows(rows)
+        return filePath
+
+    with EmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db'), cacheSize=100) as iEmpDb:
+        iEmpDb.insert_many((str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled') for entry in range(10))
+        assert iEmpDb.get_student('7')[1] == 'Name7'
+
+        # ids 5 and 6 unchanged, 7 to 9 changed, 10 to 14 new, 14 repeated
+        rows = ([(str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled', 1) for entry in (5, 6)] +
+                [(str(entry), f'New{entry}', 'BS EE', 'Male', 'Enrolled', 1) for entry in range(7, 15)] +
+                [('14', 'Again14', 'BS EE', 'Male', 'Enrolled', 1)])
+        filePath = feed('feed.csv', rows)
+
+        stats = iEmpDb.import_csv(filePath, batchSize=4, policy='skip')
+        assert (stats['rows'], stats['inserted'], stats['updated'], stats['skipped']) == (11, 5, 0, 6)
+        assert iEmpDb.get_student('7')[1] == 'Name7' and iEmpDb.get_student('14')[1] == 'New14'
+
+        stats = iEmpDb.import_csv(filePath, policy='overwrite')
+        assert (stats['inserted'], stats['updated'], stats['skipped']) == (0, 4, 7)
+        assert iEmpDb.get_student('7')[1] == 'New7' and iEmpDb.get_student('14')[1] == 'Again14'
+        assert iEmpDb.search_students('new7')[0][0] == '7'
+
+        try:
+            iEmpDb.import_csv(filePath)
+        except sqlite3.IntegrityError:
+            pass
+        else:
+            raise AssertionError('duplicate id accepted')
+
+        # rows without a recorded version lose to any version, then only higher versions win
+        stats = iEmpDb.merge_many([('1', 'V5', 'BS CoE', 'Male', 'Enrolled', 5), ('1', 'V3', 'BS CoE', 'Male', 'Enrolled', 3),
+                                   ('20', 'V5', 'BS CoE', 'Male', 'Enrolled', 5)], policy='newest')
+        assert stats == {'inserted': 1, 'updated': 1, 'skipped': 1}
+        assert iEmpDb.get_student('1')[1] == 'V5'
+        stats = iEmpDb.import_csv(feed('newest.csv', [('1', 'V4', 'BS CoE', 'Male', 'Enrolled', 4),
+                                                      ('20', 'V9', 'BS CoE', 'Male', 'Enrolled', 9)]), policy='newest')
+        assert (stats['inserted'], stats['updated'], stats['skipped']) == (0, 1, 1)
+        assert iEmpDb.get_student('1')[1] == 'V5' and iEmpDb.get_student('20')[1] == 'V9'
+
+        # a deleted row forgets its version
+        iEmpDb.delete_student('20')
+        assert iEmpDb.merge_many([('20', 'V1', 'BS CoE', 'Male', 'Enrolled', 1)], policy='newest')['inserted'] == 1
+        assert iEmpDb.count_where() == 16
+
+        for bad in ({'policy': 'replace'}, {'policy': 'newest', 'versionField': 'stamp'}):
+            try:
+                iEmpDb.import_csv(filePath, **bad)
+            except Exception as e:
+                assert 'policy' in str(e) or 'stamp' in str(e)
+            else:
+                raise AssertionError(f'{bad} accepted')
+
+def test_EmpDb_schema2(tmp_path):
+    dbName = str(tmp_path / 'EmpDbSql.db')
+    programs = ('BS CoE', 'BS ECE', 'BS EE')
+    rows = [(str(entry), f'Name{entry} Surname{entry}', programs[entry % 3], ('Male', 'Female')[entry % 2],
+             'Enrolled' if entry % 5 else 'Not Enrolled') for entry in range(300)]
+    with EmpDbSqlite(dbName=dbName) as iEmpDb:
+        iEmpDb.insert_many(rows)
+        iEmpDb.merge_many([('0', 'Old Name', 'BS CoE', 'Male', None, 3)], policy='newest')
+        expected = sorted(iEmpDb.fetch_students())
+        counts = iEmpDb.count_by('status', gender='Male')
+
+        # a failed migration leaves schema 1 in place
+        iEmpDb.insert_student('x1', 'Not A Number', 'BS EE', 'Male', 'Enrolled')
+        try:
+            iEmpDb.migrate(integerIds=True)
+        except sqlite3.Error:
+            pass
+        else:
+            raise AssertionError('text id accepted as INTEGER PRIMARY KEY')
+        assert iEmpDb.schema == 1 and iEmpDb.count_where() == 301
+        iEmpDb.delete_student('x1')
+
+        stats = iEmpDb.migrate()
+        assert stats['rows'] == 300 and iEmpDb.schema == 2
+        assert sorted(iEmpDb.fetch_students()) == expected
+        assert iEmpDb.count_by('status', gender='Male') == counts
+        assert iEmpDb.count_by('status', program='BS CoE')[None] == 1
+        assert iEmpDb.count_where(program='BS EE', status='Not Enrolled') == 20
+        assert iEmpDb.count_where(program='BS XX') == 0
+        assert iEmpDb.search_students('name7 surname7')[0][0] == '7'
+
+        # writes go through the view, new categorical values get new codes
+        iEmpDb.insert_student('300', 'Ana Cruz', 'BS ME', 'Female', 'Enrolled')
+        iEmpDb.update_student('Renamed', 'BS ME', 'Male', 'Enrolled', '1')
+        iEmpDb.delete_student('2')
+        assert iEmpDb.count_by('program')['BS ME'] == 2
+        assert iEmpDb.get_student('1') == ('1', 'Renamed', 'BS ME', 'Male', 'Enrolled')
+        assert not iEmpDb.id_exists('2') and iEmpDb.search_students('renamed')[0][0] == '1'
+        assert iEmpDb.merge_many([('0', 'Older', 'BS CoE', 'Male', 'Enrolled', 2),
+                                  ('3', 'Name3 Surname3', 'BS CoE', 'Male', 'Not Enrolled', 1)], policy='newest') == \
+            {'inserted': 0, 'updated': 1, 'skipped': 1}
+        try:
+            iEmpDb.insert_many([('4', 'Dup', 'BS CoE', 'Male', 'Enrolled')])
+        except sqlite3.IntegrityError:
+            pass
+        else:
+            raise AssertionError('duplicate id accepted')
+
+        rows, page = [], iEmpDb.fetch_page(limit=40, order_by='program')
+        while page:
+            rows.extend(page)
+            page = iEmpDb.fetch_page(after_id=page[-1][0], limit=40, order_by='program')
+        assert rows == sorted(iEmpDb.fetch_students(), key=lambda row: (row[2], row[0]))
+        # row '0' has no status, it comes first like NULL in ORDER BY
+        rows, page = [], iEmpDb.fetch_page(limit=7, order_by='status')
+        while page:
+            rows.extend(page)
+            page = iEmpDb.fetch_page(after_id=page[-1][0], limit=7, order_by='status')
+        assert rows[0][0] == '0' and rows == sorted(iEmpDb.fetch_students(), key=lambda row: (row[4] or '', row[0]))
+        plans = []
+        iEmpDb.conn.set_trace_callback(plans.append)
+        iEmpDb.fetch_page(after_id='5', limit=7, order_by='gender')
+        iEmpDb.conn.set_trace_callback(None)
+        assert len(plans) == 3
+        for statement in plans:
+            plan = iEmpDb.cursor.execute('EXPLAIN QUERY PLAN ' + statement).fetchall()
+            assert not any('TEMP B-TREE' in step[-1] or 'SCAN' in step[-1] for step in plan), plan
+
+        other = sqlite3.connect(dbName)
+        other.execute("INSERT INTO Students VALUES ('301', 'Other', 'BS CoE', 'Male', 'Enrolled')")
+        other.commit()
+        other.close()
+        assert iEmpDb.get_student('301') == ('301', 'Other', 'BS CoE', 'Male', 'Enrolled')
+
+        try:
+            iEmpDb.migrate()
+        except Exception as e:
+            assert 'schema 2' in str(e)
+        else:
+            raise AssertionError('migrated twice')
+
+    with EmpDbSqlite(dbName=dbName) as iEmpDb:
+        assert iEmpDb.schema == 2 and iEmpDb.count_where() == 301
+        assert iEmpDb.cursor.execute("SELECT type FROM sqlite_master WHERE name = 'Students'").fetchone() == ('view',)
+
+    with EmpDbSqlite(dbName=str(tmp_path / 'integer.db'), schema=2, integerIds=True) as iEmpDb:
+        iEmpDb.insert_many((str(entry), f'Name{entry}', 'BS CoE', 'Male', 'Enrolled') for entry in range(20))
+        assert iEmpDb.fetch_students()[5] == (5, 'Name5', 'BS CoE', 'Male', 'Enrolled')
+        assert iEmpDb.id_exists('5') and iEmpDb.existing_ids(['5', '50']) == {'5'}
+        assert iEmpDb.fetch_page(after_id=9, limit=2) == [(10, 'Name10', 'BS CoE', 'Male', 'Enrolled'),
+                                                          (11, 'Name11', 'BS CoE', 'Male', 'Enrolled')]
+        assert iEmpDb.search_students('name7')[0][0] == 7
+    with EmpDbSqlite(dbName=str(tmp_path / 'integer.db')) as iEmpDb:
+        assert iEmpDb.schema == 2 and iEmpDb.integerIds
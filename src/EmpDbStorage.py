@@ -0,0 +1,350 @@
+'''
+Storage engines for EmpDb
+- both engines store rows in numbered slots and share the same interface
+- a deleted slot stays empty until compact() is called
+'''
+
+import itertools
+from array import array
+from bisect import bisect_left, insort
+
+
+class EmpDbRowStorage:
+    """
+    - stores every row as an immutable tuple in fetch_students() order,
+      reads hand out the stored tuples instead of building new ones
+    - a change replaces the tuple of its slot
+    """
+
+    def __init__(self):
+        self.tuples = []
+
+    def __len__(self):
+        """
+        - returns the number of slots, including empty ones
+        """
+        return len(self.tuples)
+
+    def append(self, row):
+        """
+        - stores 'row' (id, name, program, gender, status) in a new slot
+        - returns the slot number
+        """
+        self.tuples.append(tuple(row))
+        return len(self.tuples) - 1
+
+    def extend(self, rows):
+        """
+        - stores every row of 'rows' in new consecutive slots
+        - returns the slot number of the first row
+        """
+        first = len(self.tuples)
+        self.tuples.extend(map(tuple, rows))
+        return first
+
+    def get(self, slot):
+        """
+        - returns the row stored in 'slot' as a tuple
+        """
+        return self.tuples[slot]
+
+    def set(self, slot, row):
+        """
+        - replaces the row stored in 'slot'
+        - no return value
+        """
+        self.tuples[slot] = tuple(row)
+
+    def clear(self, slot):
+        """
+        - empties 'slot'
+        - no return value
+        """
+        self.tuples[slot] = None
+
+    def rows(self):
+        """
+        - yields the rows of every non-empty slot, in slot order
+        """
+        # rows are never empty tuples, so filter(None, ...) only drops the cleared slots
+        return filter(None, self.tuples)
+
+    def compact(self):
+        """
+        - removes the empty slots, the remaining rows are renumbered from 0
+        - no return value
+        """
+        self.tuples = [row for row in self.tuples if row is not None]
+
+
+class DictColumn:
+    """
+    - dictionary encoded column for fields with few distinct values
+    - each slot holds a small integer code, 'values' maps the code back to the value
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codeOf = {}
+        self.codes = array('B')
+
+    def encode(self, value):
+        """
+        - returns the code of 'value', adding it to the dictionary if needed
+        - widens the code array when the dictionary outgrows it
+        """
+        code = self.codeOf.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codeOf[value] = code
+            if code >= 1 << (8 * self.codes.itemsize):
+                self.codes = array('H' if self.codes.typecode == 'B' else 'L', self.codes)
+        return code
+
+    def extend(self, values):
+        encode = self.encode
+        for value in values:
+            code = encode(value)
+            self.codes.append(code)
+
+    def append(self, value):
+        # encode first, it may replace self.codes with a wider array
+        code = self.encode(value)
+        self.codes.append(code)
+
+    def get(self, slot):
+        return self.values[self.codes[slot]]
+
+    def set(self, slot, value):
+        code = self.encode(value)
+        self.codes[slot] = code
+
+    def compact(self, keep):
+        """
+        - keeps only the slots listed in 'keep'
+        - no return value
+        """
+        self.codes = array(self.codes.typecode, (self.codes[slot] for slot in keep))
+
+
+class EmpDbColumnStorage:
+    """
+    - stores every field in its own column
+    - id and name are plain lists, program, gender and status are DictColumn
+    - an empty slot has None in the id column
+    - rows are decoded into new tuples on every read, no tuple views are cached
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        self.programs = DictColumn()
+        self.genders = DictColumn()
+        self.statuses = DictColumn()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, row):
+        id, name, program, gender, status = row
+        self.ids.append(id)
+        self.names.append(name)
+        self.programs.append(program)
+        self.genders.append(gender)
+        self.statuses.append(status)
+        return len(self.ids) - 1
+
+    def extend(self, rows):
+        first = len(self.ids)
+        for column, values in zip((self.ids, self.names, self.programs, self.genders, self.statuses), zip(*rows)):
+            column.extend(values)
+        return first
+
+    def get(self, slot):
+        return (self.ids[slot], self.names[slot], self.programs.get(slot), self.genders.get(slot), self.statuses.get(slot))
+
+    def set(self, slot, row):
+        id, name, program, gender, status = row
+        self.ids[slot] = id
+        self.names[slot] = name
+        self.programs.set(slot, program)
+        self.genders.set(slot, gender)
+        self.statuses.set(slot, status)
+
+    def clear(self, slot):
+        self.ids[slot] = None
+        self.names[slot] = None
+
+    def rows(self):
+        programs = self.programs.values
+        genders = self.genders.values
+        statuses = self.statuses.values
+        for id, name, program, gender, status in zip(self.ids, self.names, self.programs.codes, self.genders.codes, self.statuses.codes):
+            if id is not None:
+                yield (id, name, programs[program], genders[gender], statuses[status])
+
+    def compact(self):
+        keep = [slot for slot, id in enumerate(self.ids) if id is not None]
+        self.ids = [self.ids[slot] for slot in keep]
+        self.names = [self.names[slot] for slot in keep]
+        self.programs.compact(keep)
+        self.genders.compact(keep)
+        self.statuses.compact(keep)
+
+
+class EmpDbSlotRanks:
+    """
+    - Fenwick tree counting the non-empty slots of a storage engine
+    - finds the slot of the row at any position of the slot order in O(log n) while deleted slots are still there
+    - the owner creates it when the first slot is emptied, then calls append() for every new slot
+      and clear() for every emptied one
+    """
+
+    def __init__(self, slots):
+        """
+        - starts with 'slots' slots, all of them non-empty
+        """
+        # node i sums the (i & -i) slots ending at slot i - 1, that is i & -i while every slot is full,
+        # filled with one slice assignment per power of two
+        self.tree = array('l', bytes(array('l').itemsize * (slots + 1)))
+        width = 1
+        while width <= slots:
+            nodes = range(width, slots + 1, 2 * width)
+            self.tree[width::2 * width] = array('l', [width]) * len(nodes)
+            width *= 2
+
+    def prefix(self, slots):
+        # number of non-empty slots among the first 'slots'
+        total = 0
+        while slots:
+            total += self.tree[slots]
+            slots -= slots & -slots
+        return total
+
+    def append(self):
+        """
+        - adds a non-empty slot after the last one
+        - no return value
+        """
+        node = len(self.tree)
+        self.tree.append(1 + self.prefix(node - 1) - self.prefix(node - (node & -node)))
+
+    def clear(self, slot):
+        """
+        - marks 'slot' as empty
+        - no return value
+        """
+        node = slot + 1
+        while node < len(self.tree):
+            self.tree[node] -= 1
+            node += node & -node
+
+    def find(self, position):
+        """
+        - returns the slot of the row at 'position', counting non-empty slots from 0
+        """
+        node, remaining = 0, position + 1
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if node + step < len(self.tree) and self.tree[node + step] < remaining:
+                node += step
+                remaining -= self.tree[node]
+            step >>= 1
+        return node
+
+
+class EmpDbSortedKeys:
+    """
+    - sorted list of keys split into chunks of at most 2 * CHUNK keys, 'maxes' holds the last key of every chunk
+    - add() and remove() find the chunk with a binary search on 'maxes' and only shift the keys of that chunk,
+      so a change costs O(log n + CHUNK) instead of moving the whole list
+    """
+
+    CHUNK = 1000
+
+    def __init__(self, keys=()):
+        self.build(sorted(keys))
+
+    def build(self, keys):
+        # replaces the contents with the already sorted list 'keys'
+        self.chunks = [keys[start:start + self.CHUNK] for start in range(0, len(keys), self.CHUNK)]
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+        self.count = len(keys)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.chunks)
+
+    def add(self, key):
+        """
+        - inserts 'key' in its sorted place
+        - no return value
+        """
+        self.count += 1
+        if not self.chunks:
+            self.chunks.append([key])
+            self.maxes.append(key)
+            return
+        index = bisect_left(self.maxes, key)
+        if index == len(self.maxes):
+            # past every key, appended to the last chunk
+            index -= 1
+            self.chunks[index].append(key)
+            self.maxes[index] = key
+        else:
+            insort(self.chunks[index], key)
+        chunk = self.chunks[index]
+        if len(chunk) > 2 * self.CHUNK:
+            self.chunks[index:index + 1] = [chunk[:self.CHUNK], chunk[self.CHUNK:]]
+            self.maxes[index:index + 1] = [chunk[self.CHUNK - 1], chunk[-1]]
+
+    def update(self, keys):
+        """
+        - inserts every key of 'keys'
+        - a batch that is large next to the list is merged with a single sort, faster than one add() per key
+        - no return value
+        """
+        keys = list(keys)
+        if len(keys) > self.count // 16:
+            merged = list(self)
+            merged.extend(keys)
+            merged.sort()
+            self.build(merged)
+        else:
+            for key in keys:
+                self.add(key)
+
+    def remove(self, key):
+        """
+        - removes 'key', nothing happens if it is missing
+        - no return value
+        """
+        index = bisect_left(self.maxes, key)
+        if index == len(self.maxes):
+            return
+        chunk = self.chunks[index]
+        position = bisect_left(chunk, key)
+        if chunk[position] != key:
+            return
+        del chunk[position]
+        self.count -= 1
+        if not chunk:
+            del self.chunks[index]
+            del self.maxes[index]
+        elif position == len(chunk):
+            self.maxes[index] = chunk[-1]
+
+    def irange(self, key):
+        """
+        - yields the keys from the first one >= 'key' on, in order
+        """
+        index = bisect_left(self.maxes, key)
+        if index == len(self.maxes):
+            return
+        chunk = self.chunks[index]
+        yield from itertools.islice(chunk, bisect_left(chunk, key), None)
+        for index in range(index + 1, len(self.chunks)):
+            yield from self.chunks[index]
@@ -4,6 +4,7 @@ from tkinter import ttk
 import tkinter as tk
 from tkinter import messagebox
 from EmpDbSqlite import EmpDbSqlite
+from EmpGuiTable import EmpGuiTable
 from tkinter import filedialog
 
 class EmpGuiCtk(customtkinter.CTk):
@@ -124,6 +125,10 @@ class EmpGuiCtk(customtkinter.CTk):
         self.tree.place(x=360, y=20, width=1000, height=350)
         self.tree.bind('<ButtonRelease>', self.read_display_data)
 
+        # only the rows in view exist as items, the scrollbar covers every row
+        self.table = EmpGuiTable(self.tree, self.db)
+        self.table.scrollbar.place(x=1360, y=20, height=350)
+
         self.add_to_treeview()
 
     # new Label Widget
@@ -217,16 +222,11 @@ class EmpGuiCtk(customtkinter.CTk):
 
     # Handles
     def add_to_treeview(self):
-        students = self.db.fetch_students()
-        self.tree.delete(*self.tree.get_children())
-        for student in students:
-            print(student)
-            self.tree.insert('', END, values=student)
+        self.table.refresh()
 
     def clear_form(self, *clicked):
         if clicked:
-            self.tree.selection_remove(self.tree.focus())
-            self.tree.focus('')
+            self.table.clear_focus()
         self.id_entry.delete(0, END)
         self.name_entry.delete(0, END)
         self.program_cboxVar.set('BS CoE')
@@ -236,7 +236,7 @@ class EmpGuiCtk(customtkinter.CTk):
     def read_display_data(self, event):
         selected_item = self.tree.focus()
         if selected_item:
-            row = self.tree.item(selected_item)['values']
+            row = self.table.row(selected_item)
             self.clear_form()
             self.id_entry.insert(0, row[0])
             self.name_entry.insert(0, row[1])
@@ -259,24 +259,27 @@ class EmpGuiCtk(customtkinter.CTk):
             messagebox.showerror('Error', 'ID already exists')
         else:
             self.db.insert_student(id, name, program, gender, status)
-            self.add_to_treeview()
+            self.table.insert_row((id, name, program, gender, status))
             self.clear_form()
             messagebox.showinfo('Success', 'Data has been inserted')
 
     def delete_entry(self):
-        selected_item = self.tree.focus()
-        if not selected_item:
+        if self.table.focused() is None:
             messagebox.showerror('Error', 'Choose an student to delete')
         else:
             id = self.id_entry.get()
+            if not self.db.id_exists(id):
+                messagebox.showerror('Error', 'ID does not exist')
+                return
+            # read before the delete, it may compact the database and renumber the rows
+            place = self.table.place(id)
             self.db.delete_student(id)
-            self.add_to_treeview()
+            self.table.delete_row(id, place)
             self.clear_form()
             messagebox.showinfo('Success', 'Data has been deleted')
 
     def update_entry(self):
-        selected_item = self.tree.focus()
-        if not selected_item:
+        if self.table.focused() is None:
             messagebox.showerror('Error', 'Choose a student to update')
         else:
             id = self.id_entry.get()
@@ -285,8 +288,15 @@ class EmpGuiCtk(customtkinter.CTk):
             gender = self.gender_cboxVar.get()
             status = self.status_cboxVar.get()
             
-            self.db.update_student(self, name, program, gender, status, id)
-            self.add_to_treeview()
+            if not self.db.id_exists(id):
+                messagebox.showerror('Error', 'ID does not exist')
+                return
+            if isinstance(self.db, EmpDbSqlite):
+                self.db.update_student(name, program, gender, status, id)
+            else:
+                # EmpDb takes the new id first, the id is not edited here
+                self.db.update_student(id, name, program, gender, status, id)
+            self.table.update_row((id, name, program, gender, status))
             self.clear_form()
             self.id_entry.delete(0, END)
             messagebox.showinfo('Success', 'Data has been updated')
@@ -0,0 +1,369 @@
+'''
+Virtualized table shared by the GUIs
+- only the rows in view, plus 'overscan' rows above and below them, exist as Treeview items
+- rows are read with fetch_range() as the view scrolls, so the cost of a scroll does not depend on the row count
+- the scrollbar is driven by the row count of the database instead of the Treeview items
+- single row edits are applied to the window with insert_row(), update_row() and delete_row(),
+  without reading it again
+'''
+
+import bisect
+import tkinter as tk
+from tkinter import ttk
+
+
+class EmpGuiTable:
+    """
+    - shows every row of 'db' in 'tree', a ttk.Treeview whose columns are set up by the caller
+    - db : any backend with fetch_range(start, limit), count_where() and range_key(id)
+    - 'scrollbar' is created next to the tree and placed by the caller
+    - the focused row is remembered while it is scrolled out of the window and focused again when it comes back
+    """
+
+    def __init__(self, tree, db, overscan=20):
+        self.tree = tree
+        self.db = db
+        self.overscan = overscan
+        # rows that fit in the tree, measured from the tree's own scroll fractions
+        self.visible = int(tree.cget('height'))
+        # number of rows in the database and position of the first row in view
+        self.count = 0
+        self.top = 0
+        # position of the first item and the items in row order
+        self.start = 0
+        self.items = []
+        # iid -> row tuple as read from the database, str(id) -> iid, for the items in the window
+        self.rows = {}
+        self.iids = {}
+        # str(id) of the focused row, kept while its item is scrolled out of the window
+        self.focusId = None
+        # after_idle() id of the next render(), scroll events arriving before it only move 'top'
+        self.pending = None
+
+        self.scrollbar = ttk.Scrollbar(tree.master, orient=tk.VERTICAL, command=self.yview)
+        self.tree.configure(yscrollcommand=self.tree_scrolled)
+
+    def refresh(self):
+        """
+        - reads the row count and the rows in view again, keeping the scroll position
+        - no return value
+        """
+        self.count = self.db.count_where()
+        self.sync_focus()
+        self.forget(self.items)
+        self.items = []
+        self.render()
+
+    def row(self, iid):
+        """
+        - returns the row tuple of item 'iid', with the values as stored instead of converted by Tk
+        """
+        return self.rows[iid]
+
+    def focused(self):
+        """
+        - returns the id of the focused row as a str, even while it is scrolled out of the window, or None
+        """
+        self.sync_focus()
+        return self.focusId
+
+    def clear_focus(self):
+        """
+        - removes the focus and the selection
+        - no return value
+        """
+        self.tree.selection_remove(*self.tree.selection())
+        self.tree.focus('')
+        self.focusId = None
+
+    def insert_row(self, row):
+        """
+        - shows 'row', just inserted in the database, in its place among the items
+        - a row before the window only moves the positions, a row after it only grows the scrollbar
+        - the rows in view stay in view
+        - no return value
+        """
+        self.count += 1
+        if not self.items:
+            self.render()
+            return
+        keys = [self.db.range_key(self.rows[iid][0]) for iid in self.items]
+        index = bisect.bisect(keys, self.db.range_key(row[0]))
+        if index == 0 and self.start > 0:
+            self.start += 1
+            self.top += 1
+        elif index < len(keys) or self.start + len(keys) == self.count - 1:
+            # inside the window, or after its last row when that is the last row of the table
+            self.items.insert(index, self.add(row, index))
+            if index < self.top - self.start:
+                self.top += 1
+        self.settle()
+
+    def update_row(self, row):
+        """
+        - shows the new values of 'row', just updated in the database, its id and place are unchanged
+        - no return value
+        """
+        iid = self.iids.get(str(row[0]))
+        if iid is not None:
+            self.rows[iid] = row
+            self.tree.item(iid, values=row)
+
+    def place(self, id):
+        """
+        - returns where the row of 'id' is : -1 before the window, 0 in it, 1 after it
+        - read it before deleting the row for delete_row(), a delete may compact the database
+          and renumber the range keys
+        """
+        if str(id) in self.iids:
+            return 0
+        if self.items and self.db.range_key(id) < self.db.range_key(self.rows[self.items[0]][0]):
+            return -1
+        return 1
+
+    def delete_row(self, id, place):
+        """
+        - removes the row of 'id', just deleted from the database
+        - place : place(id) read before the row was deleted
+        - the rows in view stay in view
+        - no return value
+        """
+        self.count -= 1
+        iid = self.iids.get(str(id))
+        if iid is not None:
+            index = self.items.index(iid)
+            self.forget([iid])
+            del self.items[index]
+            if index < self.top - self.start:
+                self.top -= 1
+        elif place < 0:
+            self.start -= 1
+            self.top -= 1
+        if self.focusId == str(id):
+            self.focusId = None
+        self.settle()
+
+    def settle(self):
+        # scrolls the tree back to 'top' after items were added or removed before it,
+        # tree_scrolled() then reads more rows if the window got too small
+        if self.items:
+            self.tree.yview_moveto((self.top - self.start) / len(self.items))
+        elif self.count:
+            self.schedule()
+        self.update_scrollbar()
+
+    def yview(self, *args):
+        # scrollbar command, 'moveto' fraction or 'scroll' n 'units' / 'pages'
+        if args[0] == 'moveto':
+            top = int(float(args[1]) * self.count)
+        else:
+            top = self.top + int(args[1]) * (self.visible if args[2] == 'pages' else 1)
+        self.top = max(0, min(top, self.count - self.visible))
+        self.update_scrollbar()
+        self.schedule()
+
+    def tree_scrolled(self, first, last):
+        # yscrollcommand of the tree, called after the tree scrolled through its own items
+        # with the keyboard, the mouse wheel or by render()
+        first, last = float(first), float(last)
+        # a pending render() moves the items to the new 'top' anyway
+        if self.items and self.pending is None:
+            if last - first < 1:
+                self.visible = max(1, round((last - first) * len(self.items)))
+            elif len(self.items) < self.count:
+                # every item fits, the window is too small to measure the tree
+                self.visible = len(self.items)
+            self.top = self.start + round(first * len(self.items))
+            end = self.start + len(self.items)
+            if ((self.top - self.start < self.overscan // 2 and self.start > 0) or
+                    (end - self.top - self.visible < self.overscan // 2 and end < self.count)):
+                self.schedule()
+        self.update_scrollbar()
+
+    def schedule(self):
+        # renders once the pending events are handled, a fast drag of the scrollbar reads only the last window
+        if self.pending is None:
+            self.pending = self.tree.after_idle(self.render)
+
+    def render(self):
+        """
+        - makes the items match the window around 'top', the items still in it are kept,
+          only the rows scrolled into it are read
+        - no return value
+        """
+        self.pending = None
+        self.sync_focus()
+        self.top = max(0, min(self.top, self.count - self.visible))
+        first = max(0, self.top - self.overscan)
+        last = min(self.count, self.top + self.visible + self.overscan)
+        end = self.start + len(self.items)
+        if self.items and first < end and self.start < last:
+            keep = self.items[max(0, first - self.start):max(0, last - self.start)]
+            self.forget(self.items[:max(0, first - self.start)] + self.items[max(0, last - self.start):])
+            head = self.db.fetch_range(first, self.start - first) if first < self.start else []
+            tail = self.db.fetch_range(end, last - end) if last > end else []
+        else:
+            keep = []
+            self.forget(self.items)
+            head, tail = [], self.db.fetch_range(first, last - first)
+        self.items = ([self.add(row, index) for index, row in enumerate(head)] + keep +
+                      [self.add(row, tk.END) for row in tail])
+        self.start = first
+        if self.items:
+            self.tree.yview_moveto((self.top - first) / len(self.items))
+        if not self.tree.focus() and self.focusId in self.iids:
+            self.tree.focus(self.iids[self.focusId])
+            self.tree.selection_set(self.iids[self.focusId])
+        self.update_scrollbar()
+
+    def add(self, row, index):
+        # inserts the item of 'row' at 'index' of the tree, returns its iid
+        iid = self.tree.insert('', index, values=row)
+        self.rows[iid] = row
+        self.iids[str(row[0])] = iid
+        return iid
+
+    def forget(self, items):
+        # deletes 'items' from the tree
+        for iid in items:
+            del self.iids[str(self.rows.pop(iid)[0])]
+        if items:
+            self.tree.delete(*items)
+
+    def sync_focus(self):
+        # records the focused row before its item can be deleted,
+        # a focus removed while the row was in the window is forgotten
+        focus = self.tree.focus()
+        if focus:
+            self.focusId = str(self.rows[focus][0])
+        elif self.focusId in self.iids:
+            self.focusId = None
+
+    def update_scrollbar(self):
+        if self.count <= self.visible:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.top / self.count, (self.top + self.visible) / self.count)
+
+
+class StubTree:
+    # the parts of ttk.Treeview used by EmpGuiTable, 'height' rows fit in view
+    # after_idle() callbacks run when run_idle() is called
+    def __init__(self, height):
+        self.height = height
+        self.master = None
+        self.children = []
+        self.values = {}
+        self.focused = ''
+        self.selected = []
+        self.idle = []
+        self.serial = 0
+        self.scrolled = None
+
+    def cget(self, option):
+        return str(self.height)
+
+    def configure(self, yscrollcommand):
+        self.scrolled = yscrollcommand
+
+    def insert(self, parent, index, values):
+        self.serial += 1
+        iid = f'I{self.serial}'
+        self.children.insert(len(self.children) if index == tk.END else index, iid)
+        self.values[iid] = values
+        return iid
+
+    def delete(self, *items):
+        for iid in items:
+            self.children.remove(iid)
+            del self.values[iid]
+            if self.focused == iid:
+                self.focused = ''
+
+    def item(self, iid, values):
+        self.values[iid] = values
+
+    def focus(self, iid=None):
+        if iid is None:
+            return self.focused
+        self.focused = iid
+
+    def selection(self):
+        return tuple(self.selected)
+
+    def selection_set(self, iid):
+        self.selected = [iid]
+
+    def selection_remove(self, *items):
+        self.selected = [iid for iid in self.selected if iid not in items]
+
+    def yview_moveto(self, fraction):
+        first = max(0.0, min(fraction, 1 - self.height / len(self.children))) if len(self.children) > self.height else 0.0
+        self.scrolled(first, min(1.0, first + self.height / len(self.children)))
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+        return f'after#{len(self.idle)}'
+
+    def run_idle(self):
+        while self.idle:
+            self.idle.pop(0)()
+
+
+def test_EmpGuiTable(tmp_path, monkeypatch):
+    from EmpDb import EmpDb
+    from EmpDbSqlite import EmpDbSqlite
+
+    class StubScrollbar:
+        def __init__(self, master, orient, command):
+            self.command = command
+
+        def set(self, first, last):
+            self.fraction = (first, last)
+
+    monkeypatch.setattr(ttk, 'Scrollbar', StubScrollbar)
+
+    def check(table, tree):
+        # the items are the rows at their positions and 'top' is in the window
+        tree.run_idle()
+        assert [table.row(iid) for iid in tree.children] == table.db.fetch_range(table.start, len(table.items))
+        assert tree.children == table.items and table.count == table.db.count_where()
+        assert table.start <= table.top < table.start + len(table.items)
+
+    def delete(table, id):
+        place = table.place(id)
+        table.db.delete_student(id)
+        table.delete_row(id, place)
+
+    for db in (EmpDb(init=True, dbName=None), EmpDbSqlite(dbName=str(tmp_path / 'EmpDbSql.db'))):
+        for entry in range(3000):
+            db.insert_student(f'{entry:04}', f'Name{entry}', 'BS CoE', 'Male', 'Enrolled')
+        tree = StubTree(10)
+        table = EmpGuiTable(tree, db, overscan=20)
+        table.refresh()
+        check(table, tree)
+        table.yview('moveto', 0.9)
+        check(table, tree)
+        top = db.fetch_range(table.top, 1)[0]
+
+        # rows before, inside and after the window
+        row = ('2700x', 'Inserted', 'BS EE', 'Female', 'Enrolled')
+        db.insert_student(*row)
+        table.insert_row(row)
+        check(table, tree)
+        for id in ('0005', table.row(table.items[3])[0], '2999', '2700x'):
+            delete(table, id)
+            check(table, tree)
+
+        # deletes before the window, EmpDb compacts half way and renumbers every slot
+        table.tree.focus(table.iids[str(top[0])])
+        for entry in range(10, 1700):
+            delete(table, f'{entry:04}')
+        check(table, tree)
+        assert db.fetch_range(table.top, 1)[0] == top and table.focused() == str(top[0])
+        table.tree.yview_moveto(0.0)
+        check(table, tree)
+        table.yview('scroll', -1, 'pages')
+        check(table, tree)
+        if isinstance(db, EmpDbSqlite):
+            db.close()
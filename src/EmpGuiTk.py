@@ -3,6 +3,7 @@ from tkinter import ttk
 import tkinter as tk
 from tkinter import messagebox
 from EmpDbSqlite import EmpDbSqlite
+from EmpGuiTable import EmpGuiTable
 
 class EmpGuiTk(Tk):
 
@@ -116,6 +117,10 @@ class EmpGuiTk(Tk):
         self.tree.place(x=360, y=20, width=1000, height=350)
         self.tree.bind('<ButtonRelease>', self.read_display_data)
 
+        # only the rows in view exist as items, the scrollbar covers every row
+        self.table = EmpGuiTable(self.tree, self.db)
+        self.table.scrollbar.place(x=1360, y=20, height=350)
+
         self.add_to_treeview()
 
     # new Label Widget
@@ -185,16 +190,11 @@ class EmpGuiTk(Tk):
 
     # Handles
     def add_to_treeview(self):
-        employees = self.db.fetch_employees()
-        self.tree.delete(*self.tree.get_children())
-        for employee in employees:
-            print(employee)
-            self.tree.insert('', END, values=employee)
+        self.table.refresh()
 
     def clear_form(self, *clicked):
         if clicked:
-            self.tree.selection_remove(self.tree.focus())
-            self.tree.focus('')
+            self.table.clear_focus()
         self.id_entryVar.set('')
         self.name_entryVar.set('')
         self.role_cboxVar.set('SW-Engineer')
@@ -204,7 +204,7 @@ class EmpGuiTk(Tk):
     def read_display_data(self, event):
         selected_item = self.tree.focus()
         if selected_item:
-            row = self.tree.item(selected_item)['values']
+            row = self.table.row(selected_item)
             self.clear_form()
             self.id_entryVar.set(row[0])
             self.name_entryVar.set(row[1])
@@ -226,25 +226,28 @@ class EmpGuiTk(Tk):
         elif self.db.id_exists(id):
             messagebox.showerror('Error', 'ID already exists')
         else:
-            self.db.insert_employee(id, name, role, gender, status)
-            self.add_to_treeview()
+            self.db.insert_student(id, name, role, gender, status)
+            self.table.insert_row((id, name, role, gender, status))
             self.clear_form()
             messagebox.showinfo('Success', 'Data has been inserted')
 
     def delete_entry(self):
-        selected_item = self.tree.focus()
-        if not selected_item:
+        if self.table.focused() is None:
             messagebox.showerror('Error', 'Choose an employee to delete')
         else:
             id = self.id_entryVar.get()
-            self.db.delete_employee(id)
-            self.add_to_treeview()
+            if not self.db.id_exists(id):
+                messagebox.showerror('Error', 'ID does not exist')
+                return
+            # read before the delete, it may compact the database and renumber the rows
+            place = self.table.place(id)
+            self.db.delete_student(id)
+            self.table.delete_row(id, place)
             self.clear_form()
             messagebox.showinfo('Success', 'Data has been deleted')
 
     def update_entry(self):
-        selected_item = self.tree.focus()
-        if not selected_item:
+        if self.table.focused() is None:
             messagebox.showerror('Error', 'Choose an employee to update')
         else:
             id=self.id_entryVar.get()
@@ -252,8 +255,15 @@ class EmpGuiTk(Tk):
             role=self.role_cboxVar.get()
             gender=self.gender_cboxVar.get()
             status=self.status_cboxVar.get()
-            self.db.update_employee(name, role, gender, status, id)
-            self.add_to_treeview()
+            if not self.db.id_exists(id):
+                messagebox.showerror('Error', 'ID does not exist')
+                return
+            if isinstance(self.db, EmpDbSqlite):
+                self.db.update_student(name, role, gender, status, id)
+            else:
+                # EmpDb takes the new id first, the id is not edited here
+                self.db.update_student(id, name, role, gender, status, id)
+            self.table.update_row((id, name, role, gender, status))
             self.clear_form()
             messagebox.showinfo('Success', 'Data has been updated')
 